@@ -0,0 +1,269 @@
+"""AsyncRobinhood.py: asyncio counterpart of the Robinhood client, for overlapping requests """
+
+#Standard libraries
+import asyncio
+import logging
+
+#External dependencies
+from urllib3.exceptions import InvalidHeader
+from urllib3.util.retry import Retry
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+#Application-specific imports
+try:
+    from . import exceptions as RH_exception
+    from . import endpoints
+    from . import transport
+    from .paginator import HostRateLimiter
+except Exception as e:
+    import exceptions as RH_exception
+    import endpoints
+    import transport
+    from paginator import HostRateLimiter
+
+
+class AsyncRobinhood:
+    """Coroutine versions of the read-only `Robinhood` calls used by the report
+
+        Every request goes through one `aiohttp.ClientSession`, so all coroutines
+        share a single keep-alive connection pool. Use as an async context manager:
+
+            async with AsyncRobinhood() as client:
+                client.set_oath_access_token(username, password, access_token)
+                orders, dividends = await asyncio.gather(client.fetch_all(endpoints.orders()), client.dividends())
+    """
+
+    logger = logging.getLogger('Robinhood')
+    logger.addHandler(logging.NullHandler())
+
+    def __init__(self, timeout=transport.DEFAULT_TIMEOUT, retries=3, backoff_factor=0.5, pool_maxsize=20, headers=None,
+                 max_workers=None, requests_per_second=None):
+        """
+            Args:
+                timeout (float or tuple): (connect, read) timeout for every request, in seconds
+                retries (int): retries on connection errors, timeouts, 429 and 5xx
+                backoff_factor (float): base of the exponential backoff between retries
+                pool_maxsize (int): connections kept open at once
+                headers (:obj:`dict`, optional): headers to start from, e.g. a logged-in `Robinhood.headers`
+                max_workers (int, optional): maximum number of requests in flight at once, as in `Paginator`
+                requests_per_second (float, optional): per-host rate limit, None for no limit
+        """
+
+        if aiohttp is None:
+            raise ImportError('AsyncRobinhood requires aiohttp (pip install aiohttp)')
+
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_maxsize = pool_maxsize
+        self.max_workers = max_workers
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self._slots = None
+        self.headers = dict(headers or {
+            "Accept": "*/*",
+            "Accept-Encoding": "gzip, deflate",
+            "Accept-Language": "en;q=1, fr;q=0.9, de;q=0.8, ja;q=0.7, nl;q=0.6, it;q=0.5",
+            "Content-Type": "application/x-www-form-urlencoded; charset=utf-8",
+            "User-Agent": "Robinhood/6.28.0 (com.robinhood.release.Robinhood; build:5771; iOS 11.4.1) Alamofire/4.5.1"
+        })
+        # aiohttp manages keep-alive itself and rejects an explicit Connection header
+        self.headers.pop("Connection", None)
+        self.session = None
+
+    @classmethod
+    def from_sync(cls, my_trader, **kwargs):
+        """Build an async client that reuses the auth of a logged-in `Robinhood` """
+
+        kwargs.setdefault('timeout', my_trader.timeout)
+        return cls(headers=my_trader.headers, **kwargs)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, trust_env=True)
+        if self._slots is None and self.max_workers:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self._slots = None
+
+    def set_oath_access_token(self, username, password, access_token):
+        self.username = username
+        self.password = password
+        self.oauth_token = access_token
+        self.headers['Authorization'] = 'Bearer ' + self.oauth_token
+        return True
+
+
+    ###########################################################################
+    #                               GET DATA
+    ###########################################################################
+
+    def _retry_after(self, res, attempt):
+        """Seconds to wait before a retry: `Retry-After` (seconds or an HTTP date), else backoff """
+
+        value = res.headers.get('Retry-After')
+        if value:
+            try:
+                return Retry.DEFAULT.parse_retry_after(value)
+            except InvalidHeader:
+                pass
+        return self.backoff_factor * (2 ** attempt)
+
+    async def _get(self, url, params=None):
+        await self.open()
+
+        for attempt in range(self.retries + 1):
+            try:
+                delay = self.rate_limiter.reserve(url)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self._slots is not None:
+                    async with self._slots:
+                        data, delay = await self._request(url, params, attempt)
+                else:
+                    data, delay = await self._request(url, params, attempt)
+                if delay is None:
+                    return data
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+                delay = self.backoff_factor * (2 ** attempt)
+
+            self.logger.info('Retrying %s in %.2fs', url, delay)
+            await asyncio.sleep(delay)
+
+    async def _request(self, url, params, attempt):
+        # (data, None) on success, (None, seconds to wait) when the request should be retried
+        async with self.session.get(url, params=params, headers=self.headers) as res:
+            if res.status in transport.RETRY_STATUSES and attempt < self.retries:
+                return None, self._retry_after(res, attempt)
+            res.raise_for_status()
+            return await res.json(content_type=None), None
+
+    async def get_url(self, url, params=None):
+        """
+            Flat wrapper for fetching URL directly
+        """
+
+        return await self._get(url, params=params)
+
+    async def fetch_all(self, url, params=None):
+        """Follow the `next` cursor from `url`
+
+            Returns:
+                (:obj:`list`): concatenated `results` of every page
+        """
+
+        page = await self._get(url, params=params)
+        results = list(page.get('results') or [])
+        while page.get('next'):
+            page = await self._get(page['next'])
+            results.extend(page.get('results') or [])
+        return results
+
+    async def order_history(self, orderId=None):
+        """Wrapper for portfolios
+            Optional Args: add an order ID to retrieve information about a single order.
+            Returns:
+                (:obj:`dict`): JSON dict from getting orders
+        """
+
+        return await self._get(endpoints.orders(orderId))
+
+    async def options_order_history(self, orderId=None):
+        """Wrapper for portfolios
+            Optional Args: add an order ID to retrieve information about a single order.
+            Returns:
+                (:obj:`dict`): JSON dict from getting orders
+        """
+
+        return await self._get(endpoints.options_orders(orderId))
+
+    async def dividends(self):
+        """Wrapper for portfolios
+
+            Note:
+                follows the `next` cursor, so `results` holds every page
+
+            Returns:
+                (:obj: `dict`): JSON dict from getting dividends
+        """
+
+        return {'results': await self.fetch_all(endpoints.dividends()), 'next': None}
+
+    async def options_owned(self):
+        return await self.fetch_all(endpoints.options_base() + "positions/?nonzero=true")
+
+    async def quotes_data(self, stocks):
+        """Fetch quote for multiple stocks, in one single Robinhood API call
+
+            Args:
+                stocks (list<str>): stock tickers
+
+            Returns:
+                (:obj:`list` of :obj:`dict`): List of JSON contents from `quotes` endpoint, in the
+                    same order of input args. If any ticker is invalid, a None will occur at that position.
+        """
+
+        try:
+            data = await self._get(endpoints.quotes(), params={'symbols': ','.join(stocks)})
+        except aiohttp.ClientResponseError:
+            raise RH_exception.InvalidTickerSymbol()
+
+        return data["results"]
+
+    async def get_option_market_data(self, optionid):
+        """Gets a list of market data for a given optionid.
+        Args: (str) option id
+        Returns: dictionary of options market data.
+        """
+
+        try:
+            market_data = await self._get(endpoints.option_market_data(optionid)) or {}
+        except aiohttp.ClientResponseError:
+            raise RH_exception.InvalidOptionId()
+        return market_data
+
+
+async def gather_histories(client, options=1):
+    """Fetch every independent report input at the same time
+
+        Args:
+            client (:obj:`AsyncRobinhood`): authenticated client
+            options (int): 1 to include options orders and positions
+
+        Returns:
+            (:obj:`dict`): `orders`, `dividends` and, with options, `options_orders`
+                and `options_owned`, each a list of records
+    """
+
+    streams = {
+        'orders': client.fetch_all(endpoints.orders()),
+        'dividends': client.fetch_all(endpoints.dividends()),
+    }
+    if options == 1:
+        streams['options_orders'] = client.fetch_all(endpoints.options_orders())
+        streams['options_owned'] = client.options_owned()
+
+    results = await asyncio.gather(*streams.values())
+    return dict(zip(streams, results))
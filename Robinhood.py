@@ -7,6 +7,7 @@ import warnings
 import robin_stocks as r
 
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
 
 #External dependencies
 from six.moves.urllib.parse import unquote  # pylint: disable=E0401
@@ -23,9 +24,13 @@ import urllib
 try: 
     from . import exceptions as RH_exception
     from . import endpoints
+    from . import transport
+    from .response_cache import ResponseCache
 except Exception as e:
     import exceptions as RH_exception
     import endpoints
+    import transport
+    from response_cache import ResponseCache
 
 import random
 
@@ -61,8 +66,23 @@ class Robinhood:
     #                       Logging in and initializing
     ###########################################################################
 
-    def __init__(self):
-        self.session = requests.session()
+    def __init__(self, timeout=transport.DEFAULT_TIMEOUT, retries=3, backoff_factor=0.5, pool_maxsize=20, cache=True):
+        """
+            Args:
+                timeout (float or tuple): (connect, read) timeout for every request, in seconds
+                retries (int): retries on connection errors, timeouts, 429 and 5xx
+                backoff_factor (float): base of the exponential backoff between retries
+                pool_maxsize (int): keep-alive connections per host
+                cache (bool or :obj:`ResponseCache`): cache for read-only endpoints
+                    (instruments, fundamentals, chains, historicals). True for an
+                    in-memory `ResponseCache`, False to always hit the network.
+        """
+
+        self.timeout = timeout
+        if cache is True:
+            cache = ResponseCache()
+        self.cache = cache or None
+        self.session = transport.build_session(retries=retries, backoff_factor=backoff_factor, pool_maxsize=pool_maxsize)
         self.session.proxies = getproxies()
         self.headers = {
             "Accept": "*/*",
@@ -125,7 +145,7 @@ class Robinhood:
                 payload['mfa_code'] = mfa_code
 
             try:
-                res = self.session.post('https://api.robinhood.com/oauth2/token/', data=payload, timeout=300)
+                res = self.session.post(endpoints.login(), data=payload, timeout=self.timeout)
                 res.raise_for_status()
                 data = res.json()
             except requests.exceptions.HTTPError:
@@ -151,7 +171,7 @@ class Robinhood:
         """
 
         try:
-            req = self.session.post(endpoints.logout(), timeout=300)
+            req = self.session.post(endpoints.logout(), timeout=self.timeout)
             req.raise_for_status()
         except requests.exceptions.HTTPError as err_msg:
             warnings.warn('Failed to log out ' + repr(err_msg))
@@ -169,7 +189,7 @@ class Robinhood:
     def investment_profile(self):
         """Fetch investment_profile """
 
-        res = self.session.get(endpoints.investment_profile(), timeout=300)
+        res = self.session.get(endpoints.investment_profile(), timeout=self.timeout)
         res.raise_for_status()  # will throw without auth
         data = res.json()
 
@@ -186,9 +206,7 @@ class Robinhood:
                 (:obj:`dict`): JSON contents from `instruments` endpoint
         """
 
-        res = self.session.get(endpoints.instruments(), params={'query': stock.upper()}, timeout=300)
-        res.raise_for_status()
-        res = res.json()
+        res = self._get_json(endpoints.instruments(), params={'query': stock.upper()}, raise_for_status=True)
 
         # if requesting all, return entire object so may paginate with ['next']
         if (stock == ""):
@@ -209,9 +227,7 @@ class Robinhood:
         url = str(endpoints.instruments()) + str(id) + "/"
 
         try:
-            req = requests.get(url, timeout=300)
-            req.raise_for_status()
-            data = req.json()
+            data = self._get_json(url, raise_for_status=True)
         except requests.exceptions.HTTPError:
             raise RH_exception.InvalidInstrumentId()
 
@@ -237,7 +253,7 @@ class Robinhood:
 
         #Check for validity of symbol
         try:
-            req = requests.get(url, headers=self.headers, timeout=300)
+            req = self.session.get(url, timeout=self.timeout)
             req.raise_for_status()
             data = req.json()
         except requests.exceptions.HTTPError:
@@ -262,7 +278,7 @@ class Robinhood:
         url = str(endpoints.quotes()) + "?symbols=" + ",".join(stocks)
 
         try:
-            req = requests.get(url, headers=self.headers, timeout=300)
+            req = self.session.get(url, timeout=self.timeout)
             req.raise_for_status()
             data = req.json()
         except requests.exceptions.HTTPError:
@@ -355,8 +371,7 @@ class Robinhood:
             'bounds': bounds.name.lower()
         }
 
-        res = self.session.get(endpoints.historicals(), params=params, timeout=300)
-        return res.json()
+        return self._get_json(endpoints.historicals(), params=params)
 
 
     def get_news(self, stock):
@@ -368,7 +383,7 @@ class Robinhood:
                 (:obj:`dict`) values returned from `news` endpoint
         """
 
-        return self.session.get(endpoints.news(stock.upper()), timeout=300).json()
+        return self.session.get(endpoints.news(stock.upper()), timeout=self.timeout).json()
 
 
     def print_quote(self, stock=''):    # pragma: no cover
@@ -484,6 +499,37 @@ class Robinhood:
         return self.get_quote_list(stock, 'last_trade_price')
 
 
+    def last_trade_prices(self, stocks, chunk_size=75, max_workers=4):
+        """Get last trade prices for many stocks in batched quote calls
+
+            Note:
+                queries `quotes` endpoint `chunk_size` symbols at a time, chunks concurrently
+
+            Args:
+                stocks (:obj:`list`): stock tickers
+                chunk_size (int): symbols per request
+                max_workers (int): requests in flight at once
+
+            Returns:
+                (:obj:`dict`): ticker -> last trade price (float), invalid tickers are left out
+        """
+
+        stocks = sorted(set(stocks))
+        chunks = [stocks[i:i + chunk_size] for i in range(0, len(stocks), chunk_size)]
+
+        prices = {}
+        if not chunks:
+            return prices
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            for quotes in executor.map(self.quotes_data, chunks):
+                for quote in quotes:
+                    if quote is not None and quote.get('last_trade_price') is not None:
+                        prices[quote['symbol']] = float(quote['last_trade_price'])
+
+        return prices
+
+
     def previous_close(self, stock=''):
         """Get previous closing price for a stock
 
@@ -592,19 +638,30 @@ class Robinhood:
                 (:obj:`dict`): `accounts` endpoint payload
         """
 
-        res = self.session.get(endpoints.accounts(), timeout=300)
+        res = self.session.get(endpoints.accounts(), timeout=self.timeout)
         res.raise_for_status()  # auth required
         res = res.json()
 
         return res['results'][0]
 
 
-    def get_url(self, url):
+    def _get_json(self, url, params=None, raise_for_status=False):
+        """GET `url` and decode it, through `self.cache` when there is one """
+
+        if self.cache is not None:
+            return self.cache.get(self.session, url, params=params, timeout=self.timeout, raise_for_status=raise_for_status)
+
+        res = self.session.get(url, params=params, timeout=self.timeout)
+        if raise_for_status:
+            res.raise_for_status()
+        return res.json()
+
+    def get_url(self, url, params=None):
         """
             Flat wrapper for fetching URL directly
         """
 
-        return self.session.get(url, timeout=300).json()
+        return self._get_json(url, params=params)
 
     def get_popularity(self, stock=''):
         """Get the number of robinhood users who own the given stock
@@ -650,7 +707,7 @@ class Robinhood:
         """
         instrumentid = self.get_url(self.quote_data(stock)["instrument"])["id"]
         if(type(expiration_dates) == list):
-            _expiration_dates_string = expiration_dates.join(",")
+            _expiration_dates_string = ",".join(expiration_dates)
         else:
             _expiration_dates_string = expiration_dates
         chain_id = self.get_url(endpoints.chain(instrumentid))["results"][0]["id"]
@@ -668,6 +725,54 @@ class Robinhood:
                 raise RH_exception.InvalidOptionId()
             return market_data
 
+    def get_options_market_data(self, option_ids, chunk_size=40, max_workers=4):
+        """Gets market data for many options in batched multi-instrument calls
+
+            Note:
+                queries `marketdata/options/?instruments=` `chunk_size` options at a time,
+                chunks concurrently. A chunk that errors is retried one option at a time.
+
+            Args:
+                option_ids (:obj:`list`): option ids
+                chunk_size (int): options per request
+                max_workers (int): requests in flight at once
+
+            Returns:
+                (:obj:`dict`): option id -> market data dict, options that could not be
+                    fetched are left out
+        """
+
+        option_ids = list(dict.fromkeys(option_ids))
+        chunks = [option_ids[i:i + chunk_size] for i in range(0, len(option_ids), chunk_size)]
+
+        def fetch_chunk(chunk):
+            instruments = ','.join(endpoints.option_instruments(optionid) for optionid in chunk)
+            try:
+                results = self.get_url(endpoints.option_market_data() + "?instruments=" + instruments)['results']
+            except (requests.exceptions.RequestException, ValueError, KeyError):
+                results = []
+                for optionid in chunk:
+                    try:
+                        results.append(self.get_option_market_data(optionid))
+                    except (requests.exceptions.RequestException, ValueError, RH_exception.RobinhoodException):
+                        self.logger.warning('Failed to fetch market data for option %s', optionid)
+
+            found = {}
+            for data in results:
+                if data and data.get('instrument'):
+                    found[data['instrument'].rstrip('/').rsplit('/', 1)[-1]] = data
+            return found
+
+        market_data = {}
+        if not chunks:
+            return market_data
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            for found in executor.map(fetch_chunk, chunks):
+                market_data.update(found)
+
+        return market_data
+
     def options_owned(self):
         options = self.get_url(endpoints.options_base() + "positions/?nonzero=true")
         options = options['results']
@@ -678,7 +783,7 @@ class Robinhood:
         return info['results'][0]
 
     def get_option_chainid(self, symbol):
-        stock_info = self.get_url(self.endpoints['instruments'] + "?symbol=" + symbol)
+        stock_info = self.get_url(endpoints.instruments(), params={'symbol': symbol.upper()})
         stock_id = stock_info['results'][0]['id']
         params = {}
         params['equity_instrument_ids'] = stock_id
@@ -692,18 +797,97 @@ class Robinhood:
 
         return chain_id
 
+    def get_option_instruments(self, chain_id, **filters):
+        """Every option instrument of a chain, following the `next` cursor
+
+            Args:
+                chain_id (str): chain id, see `get_option_chainid`
+                **filters: extra `options/instruments` params, e.g. `expiration_dates`,
+                    `type`, `state` or `tradability`
+
+            Returns:
+                (:obj:`list` of :obj:`dict`): option instruments
+        """
+
+        params = dict(filters, chain_id=chain_id)
+        page = self.get_url(endpoints.option_instruments(), params=params)
+        instruments = list(page.get('results') or [])
+        while page.get('next'):
+            page = self.get_url(page['next'])
+            instruments.extend(page.get('results') or [])
+        return instruments
+
+    def get_option_chain_quotes(self, symbols, chunk_size=40, max_workers=4, **filters):
+        """Quote whole option chains of one or more underlyings
+
+            Note:
+                instruments are listed per chain, then marked in batched
+                `marketdata/options/?instruments=` calls, see `get_options_market_data`
+
+            Args:
+                symbols (str or list<str>): underlying tickers
+                chunk_size (int): options per market data request
+                max_workers (int): requests in flight at once
+                **filters: `options/instruments` params, e.g. `expiration_dates='2019-01-18'`
+                    or `type='call'`
+
+            Returns:
+                (:obj:`dict`): columns `symbol`, `option_id`, `expiration_date`, `strike_price`,
+                    `type` and `mark` as equal-length lists, sorted by symbol, expiration,
+                    type and strike. `mark` is None for options without market data.
+        """
+
+        if isinstance(symbols, str):
+            symbols = [symbols]
+
+        def list_chain(symbol):
+            chain_id = self.get_option_chainid(symbol)
+            if chain_id is None:
+                self.logger.warning('No tradable option chain for %s', symbol)
+                return []
+            return self.get_option_instruments(chain_id, **filters)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(symbols)))) as executor:
+            chains = list(executor.map(list_chain, symbols))
+
+        rows = []
+        for symbol, instruments in zip(symbols, chains):
+            for option in instruments:
+                rows.append((symbol.upper(), option['id'], option['expiration_date'], float(option['strike_price']), option['type']))
+        rows.sort(key=lambda row: (row[0], row[2], row[4], row[3]))
+
+        market_data = self.get_options_market_data([row[1] for row in rows], chunk_size=chunk_size, max_workers=max_workers)
+
+        marks = []
+        for row in rows:
+            mark = market_data.get(row[1], {}).get('adjusted_mark_price')
+            marks.append(float(mark) if mark is not None else None)
+
+        columns = ['symbol', 'option_id', 'expiration_date', 'strike_price', 'type']
+        quotes = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+        quotes['mark'] = marks
+        return quotes
+
     def get_option_quote(self, arg_dict):
-        chain_id = self.get_option_chainid(arg_dict.pop('symbol', None))
-        arg_dict['chain_id'] = chain_id
-        option_info = self.get_url(self.endpoints.options_base()+ "instruments/", params = arg_dict)
-        option_info = option_info['results']
-        exp_price_list = []
-
-        for op in option_info:
-            mrkt_data = self.get_option_marketdata(op['url'])
-            op_price = mrkt_data['adjusted_mark_price']
-            exp = op['expiration_date']
-            exp_price_list.append((exp, op_price))
+        """Marks of the options matching `arg_dict`
+
+            Note:
+                kept for compatibility, `get_option_chain_quotes` returns the same data by column
+
+            Args:
+                arg_dict (:obj:`dict`): `symbol` plus `options/instruments` params
+
+            Returns:
+                (:obj:`list` of :obj:`tuple`): sorted (expiration date, adjusted mark price)
+        """
+
+        arg_dict = dict(arg_dict)
+        quotes = self.get_option_chain_quotes(arg_dict.pop('symbol', None), **arg_dict)
+        exp_price_list = [
+            (exp, mark)
+            for exp, mark in zip(quotes['expiration_date'], quotes['mark'])
+            if mark is not None
+        ]
 
         exp_price_list.sort()
 
@@ -732,9 +916,7 @@ class Robinhood:
 
         #Check for validity of symbol
         try:
-            req = requests.get(url, timeout=300)
-            req.raise_for_status()
-            data = req.json()
+            data = self._get_json(url, raise_for_status=True)
         except requests.exceptions.HTTPError:
             raise RH_exception.InvalidTickerSymbol()
 
@@ -755,7 +937,7 @@ class Robinhood:
     def portfolios(self):
         """Returns the user's portfolio data """
 
-        req = self.session.get(endpoints.portfolios(), timeout=300)
+        req = self.session.get(endpoints.portfolios(), timeout=self.timeout)
         req.raise_for_status()
 
         return req.json()['results'][0]
@@ -865,7 +1047,7 @@ class Robinhood:
                 (:obj:`dict`): JSON dict from getting orders
         """
 
-        return self.session.get(endpoints.orders(orderId), timeout=300).json()
+        return self.session.get(endpoints.orders(orderId), timeout=self.timeout).json()
     @login_required
     
     def options_order_history(self, orderId=None):
@@ -875,17 +1057,30 @@ class Robinhood:
                 (:obj:`dict`): JSON dict from getting orders
         """
 
-        return self.session.get(endpoints.options_orders(orderId), timeout=300).json()
+        return self.session.get(endpoints.options_orders(orderId), timeout=self.timeout).json()
 
 
     def dividends(self):
         """Wrapper for portfolios
 
+            Note:
+                follows the `next` cursor, so `results` holds every page
+
             Returns:
                 (:obj: `dict`): JSON dict from getting dividends
         """
 
-        return self.session.get(endpoints.dividends(), timeout=300).json()
+        data = self.session.get(endpoints.dividends(), timeout=self.timeout).json()
+        results = list(data['results'])
+
+        page = data
+        while page.get('next'):
+            page = self.session.get(page['next'], timeout=self.timeout).json()
+            results.extend(page['results'])
+
+        data['results'] = results
+        data['next'] = None
+        return data
 
 
     ###########################################################################
@@ -899,7 +1094,7 @@ class Robinhood:
                 (:object: `dict`): JSON dict from getting positions
         """
 
-        return self.session.get(endpoints.positions(), timeout=300).json()
+        return self.session.get(endpoints.positions(), timeout=self.timeout).json()
 
 
     def securities_owned(self):
@@ -909,4 +1104,4 @@ class Robinhood:
                 (:object: `dict`): Non-zero positions
         """
 
-        return self.session.get(endpoints.positions() + '?nonzero=true', timeout=300).json()
\ No newline at end of file
+        return self.session.get(endpoints.positions() + '?nonzero=true', timeout=self.timeout).json()
\ No newline at end of file
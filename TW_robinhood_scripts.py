@@ -8,40 +8,26 @@ import pytz
 import random
 import json
 import csv
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 pd.options.mode.chained_assignment = None  # default='warn', to silence the errors about copy
 import Robinhood
+import endpoints
+from paginator import Paginator
+from instrument_resolver import InstrumentResolver
 
 
 ### ORDER HISTORY STUFF ###
 
-def fetch_json_by_url(my_trader, url):
-    return my_trader.session.get(url).json()
-
-def get_symbol_from_instrument_url(url, df):
-
-    try:
-        symbol = df.loc[url]['symbol']
-    
-    except Exception as e:
-        response = requests.get(url)
-        symbol = response.json()['symbol']
-        df.at[url, 'symbol'] = symbol
-        # time.sleep(np.random.randint(low=0, high=2, size=(1))[0])
-   
-    return symbol, df
-
-def order_item_info(order, my_trader, df):
+def order_item_info(order, symbols):
     #side: .side,  price: .average_price, shares: .cumulative_quantity, instrument: .instrument, date : .last_transaction_at
-    symbol, df = get_symbol_from_instrument_url(order['instrument'], df)
-    
     order_info_dict = {
         'side': order['side'],
         'avg_price': order['average_price'],
         'order_price': order['price'],
         'order_quantity': order['quantity'],
         'shares': order['cumulative_quantity'],
-        'symbol': symbol,
+        'symbol': symbols[order['instrument']],
         'id': order['id'],
         'date': order['last_transaction_at'],
         'state': order['state'],
@@ -50,20 +36,41 @@ def order_item_info(order, my_trader, df):
 
     return order_info_dict
 
-def get_all_history_orders(my_trader):
-    
-    orders = []
-    past_orders = my_trader.order_history()
-    orders.extend(past_orders['results'])
+def get_all_history_orders(my_trader, paginator=None):
+
+    if paginator is None:
+        paginator = Paginator(my_trader)
+
+    return paginator.fetch_all(endpoints.orders())
+
+def get_all_histories(my_trader, paginator=None, options=1, order_store=None, options_order_store=None):
+    # Walk the order, options-order and dividend streams at the same time,
+    # so the full pull costs roughly as long as the longest stream
+    if paginator is None:
+        paginator = Paginator(my_trader)
+
+    stores = {'orders': order_store}
+    if options == 1:
+        stores['options_orders'] = options_order_store
+    stores = dict((name, store) for name, store in stores.items() if store is not None)
+
+    streams = {'dividends': endpoints.dividends()}
+    if 'orders' not in stores:
+        streams['orders'] = endpoints.orders()
+    if options == 1 and 'options_orders' not in stores:
+        streams['options_orders'] = endpoints.options_orders()
+
+    if not stores:
+        return paginator.fetch_streams(streams)
 
-    while past_orders['next']:
-        # print("{} order fetched".format(len(orders)))
-        next_url = past_orders['next']
-        past_orders = fetch_json_by_url(my_trader, next_url)
-        orders.extend(past_orders['results'])
-    # print("{} order fetched".format(len(orders)))
+    # Orders come from their local stores, which only ask for what changed; dividends are always pulled in full
+    with ThreadPoolExecutor(max_workers=len(stores)) as executor:
+        synced = dict((name, executor.submit(store.sync, my_trader, paginator)) for name, store in stores.items())
+        histories = paginator.fetch_streams(streams)
+    for name, future in synced.items():
+        histories[name] = future.result()
 
-    return orders
+    return histories
 
 def mark_pending_orders(row):
     if row.state == 'queued' or row.state == 'confirmed':
@@ -73,71 +80,69 @@ def mark_pending_orders(row):
     return order_status_is_pending
 # df_order_history.apply(mark_pending_orders, axis=1)    
 
-def get_order_history(my_trader):
+ORDER_COLUMNS = ['state', 'order_quantity', 'shares', 'avg_price', 'date', 'id', 'order_price', 'side', 'symbol', 'type']
+
+def get_order_history(my_trader, past_orders=None, resolver=None):
     
     # Get unfiltered list of order history
-    past_orders = get_all_history_orders(my_trader)
+    if past_orders is None:
+        past_orders = get_all_history_orders(my_trader)
 
-    # Load in our pickled database of instrument-url lookups
-    instruments_df = pd.read_pickle('symbol_and_instrument_urls')
+    # Our pickled database of instrument-url lookups
+    if resolver is None:
+        resolver = InstrumentResolver(my_trader=my_trader)
 
     # Create a big dict of order history
-    orders = [order_item_info(order, my_trader, instruments_df) for order in past_orders]
+    symbols = resolver.resolve_many(order['instrument'] for order in past_orders)
+    orders = [order_item_info(order, symbols) for order in past_orders]
 
-    # Save our pickled database of instrument-url lookups
-    instruments_df.to_pickle('symbol_and_instrument_urls')
+    # Save any newly resolved instruments
+    resolver.save()
 
+    # Build the frame once, keeping the expected columns even with no orders
     df = pd.DataFrame.from_records(orders)
+    for column in ORDER_COLUMNS:
+        if column not in df.columns:
+            df[column] = pd.Series(dtype=object)
     df['ticker'] = df['symbol']
 
     columns = ['ticker', 'state', 'order_quantity', 'shares', 'avg_price', 'date', 'id', 'order_price', 'side', 'symbol', 'type']
     df = df[columns]
 
-    df['is_pending'] = df.apply(mark_pending_orders, axis=1)
+    df['is_pending'] = df.apply(mark_pending_orders, axis=1) if len(df) else pd.Series(dtype=bool)
 
-    return df, instruments_df
+    return df, resolver
 
-def get_all_history_options_orders(my_trader):
+### END ORDER HISTORY GETTING STUFF ####
 
-    options_orders = []
-    past_options_orders = my_trader.options_order_history()
-    options_orders.extend(past_options_orders['results'])
+### DIVIDENDS ###
 
-    while past_options_orders['next']:
-        # print("{} order fetched".format(len(orders)))
-        next_url = past_options_orders['next']
-        past_options_orders = fetch_json_by_url(my_trader, next_url)
-        options_orders.extend(past_options_orders['results'])
-    # print("{} order fetched".format(len(orders)))
-    
-    options_orders_cleaned = np.empty((0, 4))
-    
-    for each in options_orders:
-        if float(each['processed_premium']) < 1:
-            continue
-        else:
-#             print(each['chain_symbol'])
-#             print(each['processed_premium'])
-#             print(each['created_at'])
-#             print(each['legs'][0]['position_effect'])
-#             print("~~~")
-            if each['legs'][0]['position_effect'] == 'open':
-                value = round(float(each['processed_premium']), 2)*-1
-            else:
-                value = round(float(each['processed_premium']), 2)
-                
-            one_order = [pd.to_datetime(each['created_at']), each['chain_symbol'], value, each['legs'][0]['position_effect']]
-            options_orders_cleaned.append(one_order)
-    
-    df_options_orders_cleaned = pd.DataFrame(options_orders_cleaned)
-    df_options_orders_cleaned.columns = ['date', 'ticker', 'value', 'position_effect']
-    df_options_orders_cleaned = df_options_orders_cleaned.sort_values('date')
-    df_options_orders_cleaned = df_options_orders_cleaned.set_index('date')
+DIVIDEND_COLUMNS = ['id', 'amount', 'rate', 'position', 'instrument', 'record_date', 'payable_date', 'paid_at', 'state']
 
-    return df_options_orders_cleaned
+def get_dividends(my_trader, dividends=None, resolver=None):
 
+    # Every page of dividend records
+    if dividends is None:
+        dividends = my_trader.dividends()['results']
+
+    # Build the frame once, keeping the expected columns even with no dividends
+    df = pd.DataFrame.from_records(dividends)
+    for column in DIVIDEND_COLUMNS:
+        if column not in df.columns:
+            df[column] = pd.Series(dtype=object)
+
+    df = df.set_index('id', drop=False)
+    df.index.name = 'id'
+
+    # Map instrument urls to tickers in one pass over the instrument index
+    if resolver is None:
+        resolver = InstrumentResolver(my_trader=my_trader)
+    symbols = resolver.resolve_many(df['instrument'])
+    resolver.save()
+    df['ticker'] = df['instrument'].map(symbols)
+
+    return df
 
-### END ORDER HISTORY GETTING STUFF ####
 
 def pct_change(new_num, old_num):
     change = new_num - old_num
@@ -0,0 +1,240 @@
+"""bench_pnl.py: time every stage of the PnL pipeline against synthetic accounts
+
+    Each size gets its own `mock_robinhood` server with the given latency, and
+    every stage runs on a fresh client and an empty instrument cache, so the
+    timings include the requests a first run would make:
+
+        pagination          `get_all_history_orders`
+        symbol_resolution   `get_order_history`, instruments resolved in bulk
+        itemized_pl         `pnl_engine.itemized_pl`, open positions marked with quotes
+        dividends           dividend pages and `get_dividends`
+        options             options order pages, positions and marks
+        report              `PnLReport.run` on the downloaded histories
+        end_to_end          `PnLReport.run` from login to totals
+
+    Results are appended to a JSON-lines history file and compared with the
+    last run of the same stage, size and latency:
+
+        python3 bench_pnl.py --sizes 100 1000 10000 100000 --latency 0.02
+        python3 bench_pnl.py --max_slowdown 1.5     # exit 1 on a regression
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import endpoints
+import pnl_engine
+import Robinhood
+import TW_robinhood_scripts as rh
+from instrument_resolver import InstrumentResolver
+from mock_robinhood import MockRobinhood, synthesize
+from paginator import Paginator
+from pnl_report import PnLReport
+
+
+DEFAULT_HISTORY_PATH = 'bench_history.jsonl'
+DEFAULT_SIZES = [100, 1000, 10000]
+STAGES = ['pagination', 'symbol_resolution', 'itemized_pl', 'dividends', 'options', 'report', 'end_to_end']
+
+
+def commit():
+    """Current git commit of the repo, None outside a checkout """
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def client():
+    my_trader = Robinhood.Robinhood()
+    my_trader.set_oath_access_token('bench', 'bench', 'bench')
+    return my_trader
+
+
+class Timer:
+    """Wall time and requests served of each stage """
+
+    def __init__(self, server):
+        self.server = server
+        self.seconds = {}
+        self.requests = {}
+
+    def __call__(self, stage, function, *args, **kwargs):
+        requests = self.server.requests
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        self.seconds[stage] = min(elapsed, self.seconds.get(stage, np.inf))
+        self.requests[stage] = self.server.requests - requests
+        return result
+
+
+def bench_account(server, workdir, timer, max_workers=4):
+    """Run every stage once against `server` """
+
+    # Instrument caches start empty, as on a first run
+    for name in ('instruments', 'instruments_cold'):
+        if os.path.exists(os.path.join(workdir, name)):
+            os.remove(os.path.join(workdir, name))
+
+    my_trader = client()
+    paginator = Paginator(my_trader, max_workers=max_workers)
+    resolver = InstrumentResolver(os.path.join(workdir, 'instruments'), my_trader=my_trader, max_workers=max_workers)
+    report = PnLReport(my_trader, resolver=resolver, max_workers=max_workers)
+
+    orders = timer('pagination', rh.get_all_history_orders, my_trader, paginator)
+    timer('symbol_resolution', rh.get_order_history, my_trader, past_orders=orders, resolver=resolver)
+
+    # Frames are built with the resolver now warm, only the marking is timed
+    df_orders = report.prepared(0, {'orders': orders, 'dividends': []})['orders']
+    timer('itemized_pl', pnl_engine.itemized_pl, df_orders,
+          lambda symbols: my_trader.last_trade_prices(symbols, max_workers=max_workers))
+
+    def dividends():
+        records = paginator.fetch_all(endpoints.dividends())
+        rh.get_dividends(my_trader, dividends=records, resolver=resolver)
+        return records
+
+    def options():
+        histories = {'options_orders': paginator.fetch_all(endpoints.options_orders())}
+        report._options(histories)
+        return histories
+
+    histories = {'orders': orders, 'dividends': timer('dividends', dividends)}
+    histories.update(timer('options', options))
+
+    result = timer('report', report.run, histories=histories)
+
+    # From scratch: new client, new (empty) instrument cache, every history downloaded concurrently
+    cold_trader = client()
+    cold_resolver = InstrumentResolver(os.path.join(workdir, 'instruments_cold'), my_trader=cold_trader, max_workers=max_workers)
+    cold = PnLReport(cold_trader, resolver=cold_resolver, max_workers=max_workers)
+    timer('end_to_end', cold.run)
+
+    return result
+
+
+def run(sizes=DEFAULT_SIZES, latency=0.02, jitter=0.0, page_size=100, repeat=1, max_workers=4, seed=0):
+    """Benchmark every stage at every size
+
+        Args:
+            sizes (list<int>): orders per synthetic account
+            latency (float): seconds the mock server waits before every answer
+            jitter (float): standard deviation of that wait
+            page_size (int): results per page
+            repeat (int): runs per size, the fastest is kept
+            max_workers (int): concurrent requests
+            seed (int): seed of the synthetic accounts
+
+        Returns:
+            (:obj:`DataFrame`): one row per size and stage with `seconds` and `requests`
+    """
+
+    rows = []
+    for size in sizes:
+        account = synthesize(size, seed=seed)
+        server = MockRobinhood(account, port=0, latency=latency, jitter=jitter, page_size=page_size)
+        api_url = endpoints.api_url
+        endpoints.api_url = server.start()
+        workdir = tempfile.mkdtemp(prefix='bench-pnl-')
+        timer = Timer(server)
+        try:
+            for _ in range(repeat):
+                result = bench_account(server, workdir, timer, max_workers=max_workers)
+        finally:
+            endpoints.api_url = api_url
+            server.stop()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        print("{} orders: total PnL ${}, {}".format(size, result.total_pnl, ', '.join(
+            '{} {:.3f}s'.format(stage, timer.seconds[stage]) for stage in STAGES)))
+
+        for stage in STAGES:
+            rows.append({'orders': size, 'stage': stage, 'seconds': timer.seconds[stage], 'requests': timer.requests[stage]})
+
+    return pd.DataFrame(rows, columns=['orders', 'stage', 'seconds', 'requests'])
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['run_at', 'orders', 'latency', 'stage', 'seconds'])
+    with open(path) as history_file:
+        return pd.DataFrame([json.loads(line) for line in history_file if line.strip()])
+
+
+def record(results, path, **context):
+    """Append results to the history file, one JSON object per stage and size """
+
+    with open(path, 'a') as history_file:
+        for row in results.to_dict('records'):
+            history_file.write(json.dumps(dict(context, **row)) + '\n')
+
+
+def compare(results, history, latency):
+    """Results with the seconds of the last recorded run at the same size and latency
+
+        Returns:
+            (:obj:`DataFrame`): `results` plus `previous` and `ratio` (seconds / previous)
+    """
+
+    results = results.copy()
+    if len(history):
+        history = history[np.isclose(history['latency'].astype(float), latency)]
+        last = history.sort_values('run_at').groupby(['orders', 'stage'])['seconds'].last()
+        results['previous'] = [last.get((size, stage), np.nan) for size, stage in zip(results['orders'], results['stage'])]
+    else:
+        results['previous'] = np.nan
+    results['ratio'] = results['seconds'] / results['previous']
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", help="orders per synthetic account", type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument("--latency", help="seconds the mock API waits before every answer", type=float, default=0.02)
+    parser.add_argument("--jitter", help="standard deviation of that wait", type=float, default=0.0)
+    parser.add_argument("--page_size", help="results per page", type=int, default=100)
+    parser.add_argument("--repeat", help="runs per size, the fastest is kept", type=int, default=1)
+    parser.add_argument("--max_workers", help="maximum concurrent requests", type=int, default=4)
+    parser.add_argument("--seed", help="seed of the synthetic accounts", type=int, default=0)
+    parser.add_argument("--history", help="JSON-lines file results are appended to", default=DEFAULT_HISTORY_PATH)
+    parser.add_argument("--no_record", help="don't append this run to the history", action="store_true")
+    parser.add_argument("--max_slowdown", help="exit 1 when a stage is this many times slower than its last run", type=float)
+
+    args = parser.parse_args()
+    warnings.simplefilter('ignore')
+
+    results = run(args.sizes, latency=args.latency, jitter=args.jitter, page_size=args.page_size,
+                  repeat=args.repeat, max_workers=args.max_workers, seed=args.seed)
+
+    compared = compare(results, load_history(args.history), args.latency)
+    print(compared.pivot(index='stage', columns='orders', values='seconds').reindex(STAGES).round(3))
+    if compared['previous'].notnull().any():
+        print("\nSeconds relative to the last recorded run:")
+        print(compared.pivot(index='stage', columns='orders', values='ratio').reindex(STAGES).round(2))
+
+    if not args.no_record:
+        record(results, args.history, run_at=pd.Timestamp.now().isoformat(), commit=commit(), latency=args.latency,
+               page_size=args.page_size, max_workers=args.max_workers, seed=args.seed, python=platform.python_version(),
+               numpy=np.__version__, pandas=pd.__version__)
+
+    if args.max_slowdown is not None:
+        slower = compared[compared['ratio'] > args.max_slowdown]
+        if len(slower):
+            print("\nSlower than {}x the last run:".format(args.max_slowdown))
+            print(slower[['orders', 'stage', 'previous', 'seconds', 'ratio']].to_string(index=False))
+            sys.exit(1)
@@ -0,0 +1,163 @@
+"""buy_and_hold.py: what the account's cash flows would have earned in a benchmark """
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import pnl_engine
+
+
+DEFAULT_SERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'QQQ_close')
+
+BENCHMARK_COLUMNS = ['invested', 'shares', 'close', 'market_value', 'pnl']
+
+
+def to_days(dates):
+    """Dates (strings, datetimes, tz-aware or not) as a `datetime64[D]` array """
+
+    if isinstance(dates, np.ndarray) and dates.dtype.kind == 'M':
+        return dates.astype('datetime64[D]')
+    if not isinstance(dates, (pd.Index, pd.Series, np.ndarray, list, tuple)):
+        dates = [dates]
+    dates = pd.DatetimeIndex(pd.to_datetime(dates, utc=True)).tz_convert(None)
+    return dates.values.astype('datetime64[D]')
+
+
+class PriceSeries:
+    """Daily closes of one benchmark as two parallel arrays
+
+        `dates` is sorted `datetime64[D]`, `closes` the matching float64 closes.
+        Lookups use `np.searchsorted`, so pricing any number of dates is a
+        single vectorized call.
+    """
+
+    def __init__(self, dates, closes, name=None):
+        order = np.argsort(dates, kind='mergesort')
+        self.dates = np.asarray(dates, dtype='datetime64[D]')[order]
+        self.closes = np.ascontiguousarray(np.asarray(closes, dtype=np.float64)[order])
+        self.name = name
+
+    @classmethod
+    def from_frame(cls, df, column='close', name=None):
+        """
+            Args:
+                df (:obj:`DataFrame` or :obj:`Series`): closes indexed by date
+                column (str): column holding the close, when `df` is a DataFrame
+        """
+
+        closes = df[column] if isinstance(df, pd.DataFrame) else df
+        closes = pd.to_numeric(closes, errors='coerce').dropna()
+        return cls(to_days(closes.index), closes.values, name=name)
+
+    @property
+    def first_date(self):
+        return pd.Timestamp(self.dates[0])
+
+    @property
+    def last_date(self):
+        return pd.Timestamp(self.dates[-1])
+
+    def close_on(self, dates):
+        """Last close at or before each of `dates`
+
+            Returns:
+                (:obj:`ndarray`): closes, NaN for dates before the series starts
+        """
+
+        positions = np.searchsorted(self.dates, to_days(dates), side='right') - 1
+        closes = self.closes[np.maximum(positions, 0)]
+        return np.where(positions >= 0, closes, np.nan)
+
+
+@lru_cache(maxsize=None)
+def load_series(path=DEFAULT_SERIES_PATH, column='close'):
+    """Load a pickled close series once per process
+
+        Args:
+            path (str): pickled DataFrame (or Series) of closes indexed by date,
+                defaults to the bundled QQQ series
+            column (str): column holding the close
+
+        Returns:
+            (:obj:`PriceSeries`)
+    """
+
+    name = os.path.basename(path).split('_')[0]
+    return PriceSeries.from_frame(pd.read_pickle(path), column=column, name=name)
+
+
+def equity_cash_flows(df_orders):
+    """Dollars put into (positive) or taken out of (negative) the market per order
+
+        Args:
+            df_orders (:obj:`DataFrame`): orders indexed by date, see `pnl_engine.order_flows`
+
+        Returns:
+            (:obj:`Series`): amounts indexed by order date
+    """
+
+    flows = pnl_engine.order_flows(df_orders)
+    return pd.Series(-flows['cash_flow'].values, index=flows.index, name='amount')
+
+
+def replay(series, dates, amounts, as_of=None):
+    """Buy the benchmark with every deposit and sell it with every withdrawal
+
+        Each amount buys (or, when negative, sells) `amount / close` benchmark
+        shares at the close of its date. Withdrawals larger than the holdings
+        leave a negative share count, so the benchmark always mirrors the
+        account's cash flows exactly.
+
+        Args:
+            series (:obj:`PriceSeries`): benchmark closes
+            dates (array-like): date of each cash flow
+            amounts (array-like): dollars invested on each date, negative to withdraw
+            as_of (date or array-like, optional): dates to value the benchmark on,
+                defaults to the last close. Dates past the end of the series are
+                valued at its last close. Cash flows before the series starts have
+                no close and are dropped; cash flows after its last close are left
+                out of every valuation, so only flows within the series are replayed.
+
+        Returns:
+            (:obj:`DataFrame`): `BENCHMARK_COLUMNS` indexed by `as_of`. `invested` is
+                the net dollars put in up to that date, `pnl` is `market_value - invested`.
+    """
+
+    days = to_days(dates)
+    amounts = np.asarray(amounts, dtype=np.float64)
+
+    priced = ~np.isnan(series.close_on(days)) if len(days) else np.zeros(0, dtype=bool)
+    days, amounts = days[priced], amounts[priced]
+
+    order = np.argsort(days, kind='mergesort')
+    days, amounts = days[order], amounts[order]
+
+    cum_invested = np.concatenate([[0.0], np.cumsum(amounts)])
+    cum_shares = np.concatenate([[0.0], np.cumsum(amounts / series.close_on(days))]) if len(days) else np.zeros(1)
+
+    as_of = series.dates[-1:] if as_of is None else to_days(as_of)
+    as_of = np.minimum(as_of, series.dates[-1])
+    counts = np.searchsorted(days, as_of, side='right')
+
+    result = pd.DataFrame({
+        'invested': cum_invested[counts],
+        'shares': cum_shares[counts],
+        'close': series.close_on(as_of),
+    }, index=pd.DatetimeIndex(as_of, name='as_of'))
+    result['market_value'] = result['shares'] * result['close']
+    result['pnl'] = result['market_value'] - result['invested']
+    return result[BENCHMARK_COLUMNS]
+
+
+def lump_sum_pnl(series, allocation, start_date, end_date=None):
+    """PnL of buying `allocation` dollars of the benchmark on `start_date` and holding it
+
+        Returns:
+            (float): gain at `end_date` (or the last close), NaN if the series starts later
+    """
+
+    end_date = min(pd.Timestamp(end_date or series.last_date), series.last_date)
+    start_close, end_close = series.close_on(start_date)[0], series.close_on(end_date)[0]
+    return allocation * (end_close / start_close - 1.0)
@@ -1,14 +1,19 @@
+import os
+
+# Every endpoint hangs off this base, point ROBINHOOD_API_URL at a stand-in server to run offline
+api_url = os.environ.get('ROBINHOOD_API_URL', 'https://api.robinhood.com').rstrip('/')
+
 def login():
-    return "https://api.robinhood.com/oauth2/token/"
+    return api_url + "/oauth2/token/"
 
 def logout():
-    return "https://api.robinhood.com/api-token-logout/"
+    return api_url + "/api-token-logout/"
 
 def investment_profile():
-    return "https://api.robinhood.com/user/investment_profile/"
+    return api_url + "/user/investment_profile/"
 
 def accounts():
-    return "https://api.robinhood.com/accounts/"
+    return api_url + "/accounts/"
 
 def ach(option):
     '''
@@ -17,82 +22,77 @@ def ach(option):
         * relationships
         * transfers
     '''
-    return "https://api.robinhood.com/ach/iav/auth/" if option == "iav" else "https://api.robinhood.com/ach/{_option}/".format(_option=option)
+    return api_url + "/ach/iav/auth/" if option == "iav" else api_url + "/ach/{_option}/".format(_option=option)
 
 def applications():
-    return "https://api.robinhood.com/applications/"
+    return api_url + "/applications/"
 
 def dividends():
-    return "https://api.robinhood.com/dividends/"
+    return api_url + "/dividends/"
 
 def edocuments():
-    return "https://api.robinhood.com/documents/"
+    return api_url + "/documents/"
 
 def instruments(instrumentId=None, option=None):
     '''
     Return information about a specific instrument by providing its instrument id. 
     Add extra options for additional information such as "popularity"
     '''
-    return "https://api.robinhood.com/instruments/" + ("{id}/".format(id=instrumentId) if instrumentId else "") + ("{_option}/".format(_option=option) if option else "")
+    return api_url + "/instruments/" + ("{id}/".format(id=instrumentId) if instrumentId else "") + ("{_option}/".format(_option=option) if option else "")
 
 def margin_upgrades():
-    return "https://api.robinhood.com/margin/upgrades/"
+    return api_url + "/margin/upgrades/"
 
 def markets():
-    return "https://api.robinhood.com/markets/"
+    return api_url + "/markets/"
 
 def notifications():
-    return "https://api.robinhood.com/notifications/"
+    return api_url + "/notifications/"
 
 def orders(orderId=None):
-    return "https://api.robinhood.com/orders/" + ("{id}/".format(id=orderId) if orderId else "")
+    return api_url + "/orders/" + ("{id}/".format(id=orderId) if orderId else "")
 
 def options_orders(orderId=None):
-    return "https://api.robinhood.com/options/orders/" + ("{id}/".format(id=orderId) if orderId else "")
+    return api_url + "/options/orders/" + ("{id}/".format(id=orderId) if orderId else "")
 
 def password_reset():
-    return "https://api.robinhood.com/password_reset/request/"
+    return api_url + "/password_reset/request/"
 
 def portfolios():
-    return "https://api.robinhood.com/portfolios/"
+    return api_url + "/portfolios/"
 
 def positions():
-    return "https://api.robinhood.com/positions/"
+    return api_url + "/positions/"
 
 def quotes():
-    return "https://api.robinhood.com/quotes/"
+    return api_url + "/quotes/"
 
 def options_base():
-    return "https://api.robinhood.com/options/"
+    return api_url + "/options/"
 
 def historicals():
-    return "https://api.robinhood.com/quotes/historicals/"
+    return api_url + "/quotes/historicals/"
 
 def document_requests():
-    return "https://api.robinhood.com/upload/document_requests/"
+    return api_url + "/upload/document_requests/"
 
 def user():
-    return "https://api.robinhood.com/user/"
+    return api_url + "/user/"
 
 def watchlists():
-    return "https://api.robinhood.com/watchlists/"
+    return api_url + "/watchlists/"
 
 def news(stock):
-    return "https://api.robinhood.com/midlands/news/{_stock}/".format(_stock=stock)
+    return api_url + "/midlands/news/{_stock}/".format(_stock=stock)
 
 def fundamentals(stock):
-    return "https://api.robinhood.com/fundamentals/{_stock}/".format(_stock=stock)
+    return api_url + "/fundamentals/{_stock}/".format(_stock=stock)
 
 def tags(tag=None):
     '''
     Returns endpoint with tag concatenated.
     '''
-    return "https://api.robinhood.com/midlands/tags/tag/{_tag}/".format(_tag=tag)
-
-api_url = "https://api.robinhood.com"       
-
-def options_base():
-    return api_url + "/options/"
+    return api_url + "/midlands/tags/tag/{_tag}/".format(_tag=tag)
 
 def chain(instrumentid):
     return api_url + "/options/chains/?equity_instrument_ids={_instrumentid}".format(_instrumentid=instrumentid)
@@ -103,8 +103,11 @@ def options(chainid, dates, option_type):
 def market_data():
     return api_url + "/marketdata/"
 
-def option_market_data(optionid):
-    return api_url + "/marketdata/options/{_optionid}/".format(_optionid=optionid)
+def option_market_data(optionid=None):
+    return api_url + "/marketdata/options/" + ("{_optionid}/".format(_optionid=optionid) if optionid else "")
+
+def option_instruments(optionid=None):
+    return api_url + "/options/instruments/" + ("{_optionid}/".format(_optionid=optionid) if optionid else "")
 
 def convert_token():
-    return "https://api.robinhood.com/oauth2/migrate_token/"
\ No newline at end of file
+    return api_url + "/oauth2/migrate_token/"
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""equity_curve.py: daily account value, returns and drawdowns from order history """
+
+import numpy as np
+import pandas as pd
+
+import pnl_engine
+from buy_and_hold import to_days
+
+
+CURVE_COLUMNS = ['value', 'flow', 'income', 'pnl', 'cum_pnl', 'twr', 'drawdown']
+
+
+def _day_rows(calendar, dates):
+    """Row of `calendar` each date falls on, weekend dates roll to the next business day """
+
+    return np.searchsorted(calendar, to_days(dates), side='left')
+
+
+def _day(date):
+    """One date as `datetime64[D]`, cheaper than `to_days` for a single value """
+
+    date = pd.Timestamp(date)
+    if date.tzinfo is not None:
+        date = date.tz_convert(None)
+    return np.datetime64(date.date(), 'D')
+
+
+def _daily_sum(calendar, dates, amounts):
+    amounts = np.asarray(amounts, dtype=np.float64)
+    if not len(amounts):
+        return np.zeros(len(calendar))
+    rows = _day_rows(calendar, dates)
+    keep = rows < len(calendar)
+    return np.bincount(rows[keep], weights=amounts[keep], minlength=len(calendar))
+
+
+class EquityCurve:
+    """Daily value, cash flows and returns of the equities in an account
+
+        The curve is one row per business day. `value` is the market value of
+        the shares held, `flow` the money put into stocks that day (buys minus
+        sells) and `income` the dividends and options premium received, so that
+        `pnl = value - previous value - flow + income`.
+
+        PnL, net flows and time-weighted return are differences of cumulative
+        arrays, so each costs O(1) per date range after the O(log n) lookup of
+        its rows. The drawdown scans the window's rows, O(window), and the
+        money-weighted return evaluates them once per bisection step,
+        O(window * iterations); `summary` costs as much as those two.
+    """
+
+    def __init__(self, dates, value, flow, income=None):
+        """
+            Args:
+                dates (array-like): business days, sorted
+                value (array-like): market value at each day's close
+                flow (array-like): money invested that day, negative when taken out
+                income (array-like, optional): dividends and other PnL not held in `value`
+        """
+
+        self.dates = to_days(dates)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.flow = np.asarray(flow, dtype=np.float64)
+        self.income = np.zeros(len(self.dates)) if income is None else np.asarray(income, dtype=np.float64)
+
+        previous = np.concatenate([[0.0], self.value[:-1]])
+        self.pnl = self.value - previous - self.flow + self.income
+
+        # Flows land at the start of the day, so they are at risk for the whole day
+        base = previous + np.maximum(self.flow, 0.0)
+        returns = np.divide(self.pnl, base, out=np.zeros(len(base)), where=base > 0)
+        self.returns = np.maximum(returns, -1.0 + 1e-12)
+
+        self.cum_pnl = np.concatenate([[0.0], np.cumsum(self.pnl)])
+        self.cum_flow = np.concatenate([[0.0], np.cumsum(self.flow)])
+        self.cum_log_growth = np.concatenate([[0.0], np.cumsum(np.log1p(self.returns))])
+
+    @classmethod
+    def from_history(cls, df_orders, price_store=None, df_dividends=None, df_options=None, end_date=None):
+        """Rebuild daily positions from orders and mark them to market
+
+            Args:
+                df_orders (:obj:`DataFrame`): orders indexed by date, see `pnl_engine.order_flows`
+                price_store (:obj:`PriceStore`, optional): daily closes to mark with. Days
+                    (or symbols) without a stored close are marked at the last traded price.
+                df_dividends (:obj:`DataFrame`, optional): dividends with `amount`, indexed by date
+                df_options (:obj:`DataFrame`, optional): options cash flows with `value`, indexed by date
+                end_date (date, optional): last day of the curve, defaults to today
+
+            Returns:
+                (:obj:`EquityCurve`)
+        """
+
+        flows = pnl_engine.order_flows(df_orders)
+        flows = flows.iloc[np.argsort(to_days(flows.index), kind='mergesort')]
+
+        first = to_days(flows.index).min() if len(flows) else _day(pd.Timestamp.now())
+        for extra in (df_dividends, df_options):
+            if extra is not None and len(extra):
+                first = min(first, to_days(extra.index).min())
+        last = _day(end_date if end_date is not None else pd.Timestamp.now())
+
+        calendar = np.arange(first, last + 1, dtype='datetime64[D]')
+        calendar = calendar[np.is_busday(calendar)]
+        n_days = len(calendar)
+
+        rows = _day_rows(calendar, flows.index)
+        keep = rows < n_days
+        flows, rows = flows[keep], rows[keep]
+
+        symbols, columns = np.unique(flows['symbol'].values.astype(str), return_inverse=True)
+
+        shares = np.zeros((n_days, len(symbols)))
+        np.add.at(shares, (rows, columns), flows['share_flow'].values)
+        shares = np.cumsum(shares, axis=0)
+        # Free stocks sold without a buy leave negative counts, they hold no value
+        shares[shares < pnl_engine.SHARES_EPSILON] = 0.0
+
+        # Last traded price as a fallback mark, carried forward
+        traded = np.full((n_days, len(symbols)), np.nan)
+        traded[rows, columns] = flows['price'].values
+        marks = pd.DataFrame(traded).ffill().to_numpy(copy=True)
+
+        if price_store is not None:
+            for column, symbol in enumerate(symbols):
+                if symbol in price_store:
+                    closes = price_store.close_on(symbol, calendar)
+                    marks[:, column] = np.where(np.isnan(closes), marks[:, column], closes)
+
+        value = np.nansum(shares * marks, axis=1)
+        flow = np.bincount(rows, weights=-flows['cash_flow'].values, minlength=n_days)
+
+        income = np.zeros(n_days)
+        if df_dividends is not None and len(df_dividends):
+            income += _daily_sum(calendar, df_dividends.index, pd.to_numeric(df_dividends['amount']).values)
+        if df_options is not None and len(df_options):
+            income += _daily_sum(calendar, df_options.index, pd.to_numeric(df_options['value']).values)
+
+        return cls(calendar, value, flow, income)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def window(self, start=None, end=None):
+        """First and last row (inclusive) of the business days between `start` and `end` """
+
+        first = 0 if start is None else int(np.searchsorted(self.dates, _day(start), side='left'))
+        last = len(self.dates) - 1 if end is None else int(np.searchsorted(self.dates, _day(end), side='right')) - 1
+        return first, last
+
+    def pnl_between(self, start=None, end=None):
+        first, last = self.window(start, end)
+        return self.cum_pnl[last + 1] - self.cum_pnl[first] if last >= first else 0.0
+
+    def flow_between(self, start=None, end=None):
+        first, last = self.window(start, end)
+        return self.cum_flow[last + 1] - self.cum_flow[first] if last >= first else 0.0
+
+    def twr(self, start=None, end=None):
+        """Time-weighted return between two dates, unaffected by when money came in """
+
+        first, last = self.window(start, end)
+        if last < first:
+            return 0.0
+        return float(np.expm1(self.cum_log_growth[last + 1] - self.cum_log_growth[first]))
+
+    def max_drawdown(self, start=None, end=None):
+        """Deepest fall of the time-weighted growth from a previous high, as a negative fraction
+
+            Scans the rows of the window, O(window).
+        """
+
+        first, last = self.window(start, end)
+        if last < first:
+            return 0.0
+        growth = np.exp(self.cum_log_growth[first:last + 2] - self.cum_log_growth[first])
+        return float(np.min(growth / np.maximum.accumulate(growth) - 1.0))
+
+    def mwr(self, start=None, end=None, tolerance=1e-10, max_iterations=200):
+        """Money-weighted (XIRR) annual return between two dates
+
+            The value held before `start` counts as invested on the first day
+            and the value at `end` as taken out on the last. Every bisection
+            step sums over the rows of the window, O(window * iterations).
+
+            Returns:
+                (float): annualized rate, NaN when the flows have no solution
+        """
+
+        first, last = self.window(start, end)
+        if last < first:
+            return np.nan
+
+        opening = self.value[first - 1] if first > 0 else 0.0
+        cash = -(self.flow[first:last + 1] - self.income[first:last + 1])
+        cash[0] -= opening
+        cash[-1] += self.value[last]
+
+        years = (self.dates[first:last + 1] - self.dates[first]).astype(np.float64) / 365.0
+
+        def npv(rate):
+            return np.sum(cash * np.power(1.0 + rate, -years))
+
+        low, high = -0.9999, 1.0
+        while npv(high) > 0 and high < 1e6:
+            high *= 10.0
+        if np.sign(npv(low)) == np.sign(npv(high)):
+            return np.nan
+
+        for _ in range(max_iterations):
+            mid = (low + high) / 2.0
+            if np.sign(npv(mid)) == np.sign(npv(low)):
+                low = mid
+            else:
+                high = mid
+            if high - low < tolerance:
+                break
+        return (low + high) / 2.0
+
+    def summary(self, start=None, end=None):
+        """Every window statistic at once
+
+            Returns:
+                (:obj:`dict`): `pnl`, `net_invested`, `twr`, `mwr` and `max_drawdown`
+        """
+
+        return {
+            'pnl': self.pnl_between(start, end),
+            'net_invested': self.flow_between(start, end),
+            'twr': self.twr(start, end),
+            'mwr': self.mwr(start, end),
+            'max_drawdown': self.max_drawdown(start, end),
+        }
+
+    def frame(self):
+        """The daily curve
+
+            Returns:
+                (:obj:`DataFrame`): `CURVE_COLUMNS` indexed by `date`. `twr` is the
+                    cumulative time-weighted return since the first day.
+        """
+
+        growth = np.exp(self.cum_log_growth[1:])
+        df = pd.DataFrame({
+            'value': self.value,
+            'flow': self.flow,
+            'income': self.income,
+            'pnl': self.pnl,
+            'cum_pnl': self.cum_pnl[1:],
+            'twr': growth - 1.0,
+            'drawdown': growth / np.maximum.accumulate(growth) - 1.0,
+        }, index=pd.DatetimeIndex(self.dates, name='date'))
+        return df[CURVE_COLUMNS]
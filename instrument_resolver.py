@@ -0,0 +1,222 @@
+"""instrument_resolver.py: instrument url -> ticker symbol lookups backed by a pickled cache """
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+    import msvcrt
+
+import pandas as pd
+
+import endpoints
+import transport
+
+
+DEFAULT_CACHE_PATH = 'symbol_and_instrument_urls'
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on `path` + '.lock', across processes """
+
+    with open(path + '.lock', 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:  # pragma: no cover
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:  # pragma: no cover
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class InstrumentResolver:
+    """Resolves Robinhood instrument urls to ticker symbols
+
+        The cache file is the `symbol_and_instrument_urls` pickle (a DataFrame of
+        `symbol` indexed by `url`). It is read into a plain dict on first use and
+        only written back, atomically, when new instruments were resolved. Saves
+        hold a file lock and merge with what is on disk, so processes sharing
+        one cache never drop each other's instruments.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, my_trader=None, chunk_size=50, max_workers=4):
+        """
+            Args:
+                path (str): cache pickle, created on save if missing
+                my_trader (:obj:`Robinhood`, optional): client whose session fetches unknown instruments
+                chunk_size (int): instrument ids per bulk `instruments/?ids=` request
+                max_workers (int): bulk requests in flight at once
+        """
+
+        self.path = path
+        self.my_trader = my_trader
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self._session = None
+        self._symbols = None
+        self._dirty = False
+
+    @property
+    def session(self):
+        """(:obj:`requests.Session`): keep-alive session used for lookups """
+
+        if self.my_trader is not None:
+            return self.my_trader.session
+        if self._session is None:
+            self._session = transport.build_session()
+        return self._session
+
+    @property
+    def timeout(self):
+        return getattr(self.my_trader, 'timeout', transport.DEFAULT_TIMEOUT)
+
+    @property
+    def symbols(self):
+        """(:obj:`dict`): url -> symbol, loaded from disk on first access """
+
+        if self._symbols is None:
+            self._symbols = self._load()
+        return self._symbols
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+
+        cached = pd.read_pickle(self.path)
+        if isinstance(cached, dict):
+            return dict(cached)
+        return cached['symbol'].to_dict()
+
+    def __contains__(self, url):
+        return url in self.symbols
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add(self, url, symbol):
+        """Record a resolved instrument """
+
+        if self.symbols.get(url) != symbol:
+            self.symbols[url] = symbol
+            self._dirty = True
+
+    def fetch_symbol(self, url):
+        """Fetch the symbol of a single instrument from the API """
+
+        res = self.session.get(url, timeout=self.timeout)
+        res.raise_for_status()
+        return res.json()['symbol']
+
+    def _fetch_chunk(self, ids):
+        res = self.session.get(endpoints.instruments(), params={'ids': ','.join(ids)}, timeout=self.timeout)
+        res.raise_for_status()
+        return [each for each in res.json()['results'] if each]
+
+    def fetch_symbols(self, urls):
+        """Fetch the symbols of many instruments in bulk
+
+            Instrument ids are looked up `chunk_size` at a time through the
+            `instruments` endpoint, with the chunks requested concurrently over
+            one pooled session. Anything the bulk lookup does not return is
+            fetched from its own url.
+
+            Args:
+                urls (iterable of str): instrument urls
+
+            Returns:
+                (:obj:`dict`): url -> symbol
+        """
+
+        ids = {}
+        for url in urls:
+            ids[url.rstrip('/').rsplit('/', 1)[-1]] = url
+
+        id_list = list(ids)
+        chunks = [id_list[i:i + self.chunk_size] for i in range(0, len(id_list), self.chunk_size)]
+
+        found = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(chunks)))) as executor:
+            for instruments in executor.map(self._fetch_chunk, chunks):
+                for instrument in instruments:
+                    url = ids.get(instrument['id'], instrument['url'])
+                    found[url] = instrument['symbol']
+
+        for url in set(ids.values()).difference(found):
+            found[url] = self.fetch_symbol(url)
+
+        return found
+
+    def resolve(self, url):
+        """Symbol for an instrument url, fetched and cached on a miss
+
+            Args:
+                url (str): instrument url
+
+            Returns:
+                (str): ticker symbol
+        """
+
+        symbol = self.symbols.get(url)
+        if symbol is None:
+            symbol = self.fetch_symbol(url)
+            self.add(url, symbol)
+        return symbol
+
+    def resolve_many(self, urls):
+        """Symbols for a collection of instrument urls
+
+            Args:
+                urls (iterable of str): instrument urls, duplicates allowed
+
+            Returns:
+                (:obj:`dict`): url -> symbol for every distinct url
+        """
+
+        wanted = set(urls)
+        missing = wanted.difference(self.symbols)
+
+        if missing:
+            for url, symbol in self.fetch_symbols(missing).items():
+                self.add(url, symbol)
+
+        symbols = self.symbols
+        return {url: symbols[url] for url in wanted}
+
+    def save(self):
+        """Write the cache back to disk if anything new was resolved """
+
+        if not self._dirty:
+            return
+
+        with file_lock(self.path):
+            # Another process may have saved since we loaded, keep its instruments too
+            symbols = self._load()
+            symbols.update(self.symbols)
+            self._symbols = symbols
+
+            df = pd.DataFrame({'symbol': pd.Series(symbols, dtype=object)})
+            df.index.name = 'url'
+
+            # Write next to the target then swap it in, so readers never see a partial file
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.instruments-')
+            os.close(fd)
+            try:
+                df.to_pickle(tmp_path)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+
+        self._dirty = False
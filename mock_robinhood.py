@@ -0,0 +1,748 @@
+"""mock_robinhood.py: local stand-in for the Robinhood API, serving synthetic accounts
+
+    `synthesize` builds a reproducible account (orders, dividends, options
+    orders and positions, instruments, daily closes and quotes) of any size,
+    kept as numpy columns so a million orders fit in a few tens of MB. Payloads
+    are only rendered, page by page, when they are requested. Accounts can be
+    saved to and loaded from a `.npz` fixture.
+
+    `MockRobinhood` serves an account over HTTP with the API's pagination
+    (`next` cursors, newest first, `updated_at[gte]` filters) and an optional
+    delay per request. Point the client at it with `ROBINHOOD_API_URL`:
+
+        python3 mock_robinhood.py --orders 100000 --latency 0.05 --save account.npz
+        ROBINHOOD_API_URL=http://127.0.0.1:8766 python3 get_profit_and_loss.py --access_token x --username x --password x
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+import numpy as np
+
+
+DEFAULT_PORT = 8766
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_START_DATE = '2014-01-02'
+DEFAULT_END_DATE = '2020-12-31'
+
+ORDER_STATES = ('filled', 'cancelled', 'queued', 'confirmed')
+SIDES = ('buy', 'sell')
+ORDER_TYPES = ('market', 'limit')
+OPTION_TYPES = ('call', 'put')
+
+# Seconds after midnight UTC of the regular session, 9:30 to 16:00 New York
+SESSION_SECONDS = (13 * 3600 + 30 * 60, 20 * 3600)
+FILL_DELAY = 2
+
+
+def _uuid(kind, index, seed):
+    """Deterministic uuid-shaped id, the index can be read back from its first field """
+
+    return '{:08x}-{:04x}-4000-8000-{:012x}'.format(int(index), kind, seed)
+
+
+def _index(uuid):
+    return int(uuid[:8], 16)
+
+
+def _timestamp(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(int(seconds))) + '.000000Z'
+
+
+def _seconds(timestamp):
+    return np.datetime64(timestamp.rstrip('Z'), 's').astype(np.int64)
+
+
+def _money(value, digits=2):
+    return None if value is None or np.isnan(value) else '{:.{}f}'.format(value, digits)
+
+
+class SyntheticAccount:
+    """Columns of one synthetic account, see `synthesize` """
+
+    # Arrays saved in a fixture, everything else is derived from them
+    FIELDS = (
+        'symbols', 'days', 'closes',
+        'order_time', 'order_symbol', 'order_side', 'order_state', 'order_type', 'order_quantity', 'order_price',
+        'dividend_symbol', 'dividend_day', 'dividend_amount', 'dividend_position',
+        'contract_symbol', 'contract_type', 'contract_strike', 'contract_expiration', 'contract_quantity',
+        'contract_short', 'contract_open_time', 'contract_open_price', 'contract_close_time', 'contract_close_price',
+        'contract_mark',
+    )
+
+    def __init__(self, seed=0, **columns):
+        self.seed = seed
+        for name in self.FIELDS:
+            setattr(self, name, columns[name])
+
+        # Options orders: an opening order per contract, a closing one for those closed, oldest first
+        opens = np.arange(len(self.contract_symbol))
+        closes = np.flatnonzero(self.contract_close_time >= 0)
+        times = np.concatenate([self.contract_open_time, self.contract_close_time[closes]])
+        order = np.argsort(times, kind='mergesort')
+        self.option_order_contract = np.concatenate([opens, closes])[order]
+        self.option_order_closing = np.concatenate([np.zeros(len(opens), bool), np.ones(len(closes), bool)])[order]
+        self.option_order_time = times[order]
+
+        self.order_updated = self.order_time + FILL_DELAY
+        self._symbol_index = dict((symbol, i) for i, symbol in enumerate(self.symbols))
+
+    def __len__(self):
+        return len(self.order_time)
+
+    def save(self, path):
+        """Write the account to a compressed `.npz` fixture """
+
+        np.savez_compressed(path, seed=self.seed, **dict((name, getattr(self, name)) for name in self.FIELDS))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as fixture:
+            return cls(seed=int(fixture['seed']), **dict((name, fixture[name]) for name in cls.FIELDS))
+
+    def symbol_index(self, symbol):
+        return self._symbol_index.get(symbol.upper())
+
+    # Payloads, `base` is the server url the account is served from
+
+    def instrument(self, i, base):
+        instrument_id = _uuid(1, i, self.seed)
+        return {
+            'id': instrument_id,
+            'url': '{}/instruments/{}/'.format(base, instrument_id),
+            'symbol': str(self.symbols[i]),
+            'simple_name': str(self.symbols[i]),
+            'name': '{} Inc.'.format(self.symbols[i]),
+            'quote': '{}/quotes/{}/'.format(base, self.symbols[i]),
+            'tradeable': True,
+            'state': 'active',
+            'country': 'US',
+            'type': 'stock',
+        }
+
+    def instrument_url(self, i, base):
+        return '{}/instruments/{}/'.format(base, _uuid(1, i, self.seed))
+
+    def quote(self, i, base):
+        last = self.closes[-1, i]
+        previous = self.closes[-2, i] if len(self.closes) > 1 else last
+        return {
+            'symbol': str(self.symbols[i]),
+            'last_trade_price': _money(last, 4),
+            'previous_close': _money(previous, 4),
+            'ask_price': _money(last * 1.001, 4),
+            'bid_price': _money(last * 0.999, 4),
+            'updated_at': _timestamp(self.days[-1].astype('datetime64[s]').astype(np.int64) + SESSION_SECONDS[1]),
+            'trading_halted': False,
+            'has_traded': True,
+            'instrument': self.instrument_url(i, base),
+        }
+
+    def historicals(self, i, span_days):
+        first = np.searchsorted(self.days, self.days[-1] - np.timedelta64(span_days, 'D'), side='left')
+        closes = self.closes[:, i]
+        # Each day opens at the previous close
+        opens = np.concatenate([closes[:1], closes[:-1]])[first:]
+        closes = closes[first:]
+        return {
+            'symbol': str(self.symbols[i]),
+            'interval': 'day',
+            'historicals': [{
+                'begins_at': '{}T00:00:00Z'.format(day),
+                'open_price': _money(open_price, 4),
+                'close_price': _money(close, 4),
+                'high_price': _money(max(open_price, close) * 1.01, 4),
+                'low_price': _money(min(open_price, close) * 0.99, 4),
+                'volume': 1000000,
+                'session': 'reg',
+                'interpolated': False,
+            } for day, open_price, close in zip(self.days[first:].astype(str), opens, closes)],
+        }
+
+    def order(self, i, base):
+        order_id = _uuid(2, i, self.seed)
+        state = ORDER_STATES[self.order_state[i]]
+        filled = state == 'filled'
+        quantity = _money(self.order_quantity[i], 5)
+        price = _money(self.order_price[i])
+        return {
+            'id': order_id,
+            'url': '{}/orders/{}/'.format(base, order_id),
+            'account': '{}/accounts/5RY00000/'.format(base),
+            'instrument': self.instrument_url(self.order_symbol[i], base),
+            'side': SIDES[self.order_side[i]],
+            'type': ORDER_TYPES[self.order_type[i]],
+            'trigger': 'immediate',
+            'time_in_force': 'gfd',
+            'state': state,
+            'quantity': quantity,
+            'cumulative_quantity': quantity if filled else '0.00000',
+            'price': price,
+            'average_price': price if filled else None,
+            'fees': '0.00',
+            'executions': [{
+                'price': price,
+                'quantity': quantity,
+                'timestamp': _timestamp(self.order_updated[i]),
+            }] if filled else [],
+            'created_at': _timestamp(self.order_time[i]),
+            'updated_at': _timestamp(self.order_updated[i]),
+            'last_transaction_at': _timestamp(self.order_updated[i]),
+        }
+
+    def dividend(self, i, base):
+        dividend_id = _uuid(3, i, self.seed)
+        record_date = self.dividend_day[i]
+        payable_date = record_date + np.timedelta64(14, 'D')
+        paid = payable_date <= self.days[-1]
+        position = self.dividend_position[i]
+        return {
+            'id': dividend_id,
+            'url': '{}/dividends/{}/'.format(base, dividend_id),
+            'account': '{}/accounts/5RY00000/'.format(base),
+            'instrument': self.instrument_url(self.dividend_symbol[i], base),
+            'amount': _money(self.dividend_amount[i]),
+            'rate': _money(self.dividend_amount[i] / position, 8),
+            'position': _money(position, 8),
+            'withholding': '0.00',
+            'record_date': str(record_date),
+            'payable_date': str(payable_date),
+            'paid_at': '{}T00:00:00Z'.format(payable_date) if paid else None,
+            'state': 'paid' if paid else 'pending',
+        }
+
+    def option_id(self, contract):
+        return _uuid(4, contract, self.seed)
+
+    def option_instrument_url(self, contract, base):
+        return '{}/options/instruments/{}/'.format(base, self.option_id(contract))
+
+    def option_order(self, i, base):
+        contract = self.option_order_contract[i]
+        closing = self.option_order_closing[i]
+        order_id = _uuid(5, i, self.seed)
+
+        # Long contracts are bought to open and sold to close, short ones the other way round
+        buying = bool(self.contract_short[contract]) == bool(closing)
+        price = self.contract_close_price[contract] if closing else self.contract_open_price[contract]
+        quantity = self.contract_quantity[contract]
+        created = self.option_order_time[i]
+        premium = price * quantity * 100.0
+
+        return {
+            'id': order_id,
+            'ref_id': order_id,
+            'chain_symbol': str(self.symbols[self.contract_symbol[contract]]),
+            'direction': 'debit' if buying else 'credit',
+            'type': 'limit',
+            'time_in_force': 'gfd',
+            'trigger': 'immediate',
+            'state': 'filled',
+            'quantity': _money(quantity, 5),
+            'processed_quantity': _money(quantity, 5),
+            'price': _money(price),
+            'premium': _money(price * 100.0),
+            'processed_premium': _money(premium),
+            'opening_strategy': None if closing else 'long_{}'.format(OPTION_TYPES[self.contract_type[contract]]),
+            'closing_strategy': 'long_{}'.format(OPTION_TYPES[self.contract_type[contract]]) if closing else None,
+            'created_at': _timestamp(created),
+            'updated_at': _timestamp(created + FILL_DELAY),
+            'legs': [{
+                'id': _uuid(6, i, self.seed),
+                'option': self.option_instrument_url(contract, base),
+                'position_effect': 'close' if closing else 'open',
+                'side': 'buy' if buying else 'sell',
+                'ratio_quantity': 1,
+                'executions': [{
+                    'id': _uuid(7, i, self.seed),
+                    'price': _money(price),
+                    'quantity': _money(quantity, 5),
+                    'settlement_date': str(np.datetime64(int(created), 's').astype('datetime64[D]') + 2),
+                    'timestamp': _timestamp(created + FILL_DELAY),
+                }],
+            }],
+        }
+
+    def option_instrument(self, contract, base):
+        return {
+            'id': self.option_id(contract),
+            'url': self.option_instrument_url(contract, base),
+            'chain_symbol': str(self.symbols[self.contract_symbol[contract]]),
+            'type': OPTION_TYPES[self.contract_type[contract]],
+            'strike_price': _money(self.contract_strike[contract], 4),
+            'expiration_date': str(self.contract_expiration[contract]),
+            'state': 'active' if self.contract_expiration[contract] >= self.days[-1] else 'expired',
+            'tradability': 'tradable',
+        }
+
+    def open_contracts(self):
+        """Contracts neither closed nor expired at the last day """
+
+        return np.flatnonzero((self.contract_close_time < 0) & (self.contract_expiration >= self.days[-1]))
+
+    def option_position(self, contract, base):
+        return {
+            'chain_symbol': str(self.symbols[self.contract_symbol[contract]]),
+            'option': self.option_instrument_url(contract, base),
+            'option_id': self.option_id(contract),
+            'quantity': _money(self.contract_quantity[contract], 4),
+            'average_price': _money(self.contract_open_price[contract] * 100.0, 4),
+            'type': 'short' if self.contract_short[contract] else 'long',
+            'trade_value_multiplier': '100.0000',
+            'created_at': _timestamp(self.contract_open_time[contract]),
+        }
+
+    def option_market_data(self, contract, base):
+        mark = self.contract_mark[contract]
+        return {
+            'instrument': self.option_instrument_url(contract, base),
+            'adjusted_mark_price': _money(mark),
+            'mark_price': _money(mark, 4),
+            'ask_price': _money(mark * 1.02),
+            'bid_price': _money(mark * 0.98),
+            'open_interest': 100,
+            'volume': 10,
+        }
+
+    def positions(self):
+        """Shares held at the last day and their average cost, per symbol index """
+
+        filled = self.order_state == ORDER_STATES.index('filled')
+        sign = np.where(self.order_side[filled] == SIDES.index('buy'), 1.0, -1.0)
+        symbols = self.order_symbol[filled]
+        shares = np.bincount(symbols, weights=sign * self.order_quantity[filled], minlength=len(self.symbols))
+        buys = sign > 0
+        cost = np.bincount(symbols[buys], weights=(self.order_quantity[filled] * self.order_price[filled])[buys], minlength=len(self.symbols))
+        bought = np.bincount(symbols[buys], weights=self.order_quantity[filled][buys], minlength=len(self.symbols))
+        average = np.divide(cost, bought, out=np.zeros(len(cost)), where=bought > 0)
+        return shares, average
+
+    def position(self, i, shares, average, base):
+        return {
+            'url': '{}/positions/5RY00000/{}/'.format(base, _uuid(1, i, self.seed)),
+            'account': '{}/accounts/5RY00000/'.format(base),
+            'instrument': self.instrument_url(i, base),
+            'quantity': _money(shares, 5),
+            'average_buy_price': _money(average, 4),
+        }
+
+
+def synthesize(n_orders, n_symbols=None, n_dividends=None, n_option_orders=None,
+               start_date=DEFAULT_START_DATE, end_date=DEFAULT_END_DATE, seed=0):
+    """Build a reproducible synthetic account
+
+        Prices follow a random walk per symbol, orders fall in market hours at
+        those prices, a few symbols get most of the trading, and sells never
+        exceed the shares held. The newest orders may still be pending.
+
+        Args:
+            n_orders (int): equity orders, cancelled and pending ones included
+            n_symbols (int, optional): tickers traded, defaults to about 2 * sqrt(n_orders)
+            n_dividends (int, optional): dividend records, defaults to n_orders / 20
+            n_option_orders (int, optional): options orders, defaults to n_orders / 10
+            start_date (str): first day of the account
+            end_date (str): last day, quotes are the closes of that day
+            seed (int): random seed, the same arguments always give the same account
+
+        Returns:
+            (:obj:`SyntheticAccount`)
+    """
+
+    rng = np.random.default_rng(seed)
+    n_symbols = n_symbols or int(np.clip(2 * np.sqrt(n_orders), 5, 2000))
+    n_dividends = n_orders // 20 if n_dividends is None else n_dividends
+    n_option_orders = n_orders // 10 if n_option_orders is None else n_option_orders
+
+    # Distinct three and four letter tickers
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    symbols = []
+    for code in rng.choice(26 ** 3 + 26 ** 4, size=n_symbols, replace=False).tolist():
+        width = 3 if code < 26 ** 3 else 4
+        code = code if width == 3 else code - 26 ** 3
+        symbols.append(''.join(letters[code // 26 ** power % 26] for power in range(width - 1, -1, -1)))
+    symbols = np.array(symbols, dtype='U4')
+
+    days = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1, dtype='datetime64[D]')
+    days = days[np.is_busday(days)]
+    n_days = len(days)
+
+    # Daily closes, a random walk from a random starting price
+    log_returns = rng.normal(0.0003, 0.02, size=(n_days, n_symbols))
+    log_returns[0] = np.log(rng.uniform(5.0, 400.0, size=n_symbols))
+    closes = np.round(np.exp(np.cumsum(log_returns, axis=0)), 2)
+    closes = np.maximum(closes, 0.01)
+
+    # Orders, oldest first, most of them on a few popular symbols
+    popularity = 1.0 / np.arange(1, n_symbols + 1)
+    order_day = np.sort(rng.integers(0, n_days, size=n_orders))
+    order_time = (days[order_day].astype('datetime64[s]').astype(np.int64)
+                  + rng.integers(SESSION_SECONDS[0], SESSION_SECONDS[1] - 60, size=n_orders))
+    order_time.sort()
+    order_day = np.searchsorted(days.astype('datetime64[s]').astype(np.int64), order_time, side='right') - 1
+    order_symbol = rng.choice(n_symbols, size=n_orders, p=popularity / popularity.sum()).astype(np.int32)
+    order_type = (rng.random(n_orders) < 0.3).astype(np.int8)
+    order_price = np.round(closes[order_day, order_symbol] * rng.uniform(0.995, 1.005, size=n_orders), 2)
+    order_price = np.maximum(order_price, 0.01)
+
+    order_state = np.where(rng.random(n_orders) < 0.1, ORDER_STATES.index('cancelled'), ORDER_STATES.index('filled')).astype(np.int8)
+    recent = max(0, n_orders - max(1, n_orders // 200))
+    pending = rng.random(n_orders - recent) < 0.5
+    order_state[recent:][pending] = rng.choice([ORDER_STATES.index('queued'), ORDER_STATES.index('confirmed')], size=pending.sum())
+
+    # Sells only what is held: a running position per symbol, walked once
+    wanted = rng.integers(1, 100, size=n_orders).astype(np.float64)
+    sell = rng.random(n_orders) < 0.45
+    sell_all = rng.random(n_orders) < 0.3
+    filled = order_state == ORDER_STATES.index('filled')
+    order_side = np.zeros(n_orders, dtype=np.int8)
+    order_quantity = wanted.copy()
+    held = np.zeros(n_symbols)
+    for i, symbol in enumerate(order_symbol.tolist()):
+        if sell[i] and held[symbol] > 0:
+            order_side[i] = 1
+            order_quantity[i] = held[symbol] if sell_all[i] else min(wanted[i], held[symbol])
+            if filled[i]:
+                held[symbol] -= order_quantity[i]
+        elif filled[i]:
+            held[symbol] += wanted[i]
+
+    # Dividends on traded symbols, the position is whatever was bought around then
+    traded = np.unique(order_symbol) if n_orders else np.arange(n_symbols)
+    dividend_symbol = rng.choice(traded, size=n_dividends).astype(np.int32)
+    dividend_day = np.sort(days[rng.integers(0, n_days, size=n_dividends)])
+    dividend_position = rng.integers(1, 200, size=n_dividends).astype(np.float64)
+    dividend_amount = np.round(dividend_position * rng.uniform(0.05, 1.0, size=n_dividends), 2)
+
+    # Options contracts: opened once, about 70% closed before expiring
+    n_contracts = int(round(n_option_orders / 1.7))
+    contract_symbol = rng.choice(n_symbols, size=n_contracts, p=popularity / popularity.sum()).astype(np.int32)
+    contract_type = rng.integers(0, 2, size=n_contracts).astype(np.int8)
+    open_day = rng.integers(0, n_days, size=n_contracts)
+    contract_open_time = (days[open_day].astype('datetime64[s]').astype(np.int64)
+                          + rng.integers(SESSION_SECONDS[0], SESSION_SECONDS[1] - 60, size=n_contracts))
+    contract_expiration = days[open_day] + rng.integers(7, 120, size=n_contracts).astype('timedelta64[D]')
+    contract_strike = np.round(closes[open_day, contract_symbol] * rng.uniform(0.8, 1.2, size=n_contracts))
+    contract_quantity = rng.integers(1, 10, size=n_contracts).astype(np.float64)
+    contract_short = (rng.random(n_contracts) < 0.2).astype(np.int8)
+    contract_open_price = np.round(rng.uniform(0.05, 10.0, size=n_contracts), 2)
+
+    closed = rng.random(n_contracts) < 0.7
+    life = (contract_expiration - days[open_day]).astype(np.int64) * 86400
+    contract_close_time = np.where(closed, contract_open_time + (rng.random(n_contracts) * life).astype(np.int64) + 60, -1)
+    contract_close_price = np.round(contract_open_price * rng.lognormal(0.0, 0.6, size=n_contracts), 2)
+    contract_mark = np.round(contract_open_price * rng.lognormal(0.0, 0.6, size=n_contracts), 2)
+
+    return SyntheticAccount(
+        seed=seed,
+        symbols=symbols,
+        days=days,
+        closes=closes,
+        order_time=order_time,
+        order_symbol=order_symbol,
+        order_side=order_side,
+        order_state=order_state,
+        order_type=order_type,
+        order_quantity=order_quantity,
+        order_price=order_price,
+        dividend_symbol=dividend_symbol,
+        dividend_day=dividend_day,
+        dividend_amount=dividend_amount,
+        dividend_position=dividend_position,
+        contract_symbol=contract_symbol,
+        contract_type=contract_type,
+        contract_strike=contract_strike,
+        contract_expiration=contract_expiration,
+        contract_quantity=contract_quantity,
+        contract_short=contract_short,
+        contract_open_time=contract_open_time,
+        contract_open_price=contract_open_price,
+        contract_close_time=contract_close_time,
+        contract_close_price=contract_close_price,
+        contract_mark=contract_mark,
+    )
+
+
+class NotFound(Exception):
+    pass
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """Routes API paths to the account on `server.account` """
+
+    protocol_version = 'HTTP/1.1'
+
+    ROUTES = (
+        ('GET', r'^/accounts/$', 'accounts'),
+        ('GET', r'^/orders/$', 'orders'),
+        ('GET', r'^/orders/(?P<order_id>[0-9a-f-]+)/$', 'order'),
+        ('GET', r'^/options/orders/$', 'option_orders'),
+        ('GET', r'^/options/positions/$', 'option_positions'),
+        ('GET', r'^/options/instruments/(?P<option_id>[0-9a-f-]+)/$', 'option_instrument'),
+        ('GET', r'^/dividends/$', 'dividends'),
+        ('GET', r'^/positions/$', 'positions'),
+        ('GET', r'^/instruments/$', 'instruments'),
+        ('GET', r'^/instruments/(?P<instrument_id>[0-9a-f-]+)/$', 'instrument'),
+        ('GET', r'^/quotes/$', 'quotes'),
+        ('GET', r'^/quotes/historicals/$', 'historicals'),
+        ('GET', r'^/quotes/(?P<symbol>[A-Za-z.]+)/$', 'quote'),
+        ('GET', r'^/marketdata/options/$', 'option_market_data'),
+        ('GET', r'^/marketdata/options/(?P<option_id>[0-9a-f-]+)/$', 'option_market_datum'),
+        ('POST', r'^/oauth2/token/$', 'token'),
+        ('POST', r'^/api-token-logout/$', 'logout'),
+    )
+
+    @property
+    def account(self):
+        return self.server.account
+
+    @property
+    def base(self):
+        return 'http://' + (self.headers.get('Host') or '{}:{}'.format(*self.server.server_address[:2]))
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        with self.server.lock:
+            self.server.requests += 1
+        url = urlparse(self.path)
+        self.query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+
+        if self.server.latency:
+            time.sleep(max(0.0, random.gauss(self.server.latency, self.server.jitter)))
+
+        for route_method, pattern, name in self.ROUTES:
+            match = re.match(pattern, url.path)
+            if route_method == method and match:
+                try:
+                    return self.reply(getattr(self, name)(**match.groupdict()))
+                except (NotFound, IndexError, ValueError):
+                    return self.reply({'detail': 'Not found.'}, 404)
+        self.reply({'detail': 'Not found.'}, 404)
+
+    def reply(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def page(self, rows, render):
+        """One page of `rows` (indices, newest first) with a `next` cursor to the following one """
+
+        page_size = int(self.query.get('page_size') or self.server.page_size)
+        offset = int(self.query.get('cursor') or 0)
+        chunk = rows[offset:offset + page_size]
+
+        next_url = None
+        if offset + page_size < len(rows):
+            params = dict(self.query, cursor=offset + page_size)
+            next_url = '{}{}?{}'.format(self.base, urlparse(self.path).path, urlencode(params))
+
+        previous_url = None
+        if offset > 0:
+            params = dict(self.query, cursor=max(0, offset - page_size))
+            previous_url = '{}{}?{}'.format(self.base, urlparse(self.path).path, urlencode(params))
+
+        return {'previous': previous_url, 'next': next_url, 'results': [render(i, self.base) for i in chunk.tolist()]}
+
+    def newest_first(self, updated):
+        """Indices of rows updated at or after `updated_at[gte]`, newest first; `updated` is sorted """
+
+        since = self.query.get('updated_at[gte]')
+        first = np.searchsorted(updated, _seconds(since), side='left') if since else 0
+        return np.arange(len(updated) - 1, first - 1, -1)
+
+    # Endpoints
+
+    def accounts(self):
+        return {'previous': None, 'next': None, 'results': [{
+            'url': '{}/accounts/5RY00000/'.format(self.base),
+            'account_number': '5RY00000',
+            'type': 'margin',
+            'buying_power': '1000.0000',
+            'cash': '1000.0000',
+            'positions': '{}/accounts/5RY00000/positions/'.format(self.base),
+        }]}
+
+    def orders(self):
+        return self.page(self.newest_first(self.account.order_updated), self.account.order)
+
+    def order(self, order_id):
+        return self.account.order(_index(order_id), self.base)
+
+    def option_orders(self):
+        return self.page(self.newest_first(self.account.option_order_time + FILL_DELAY), self.account.option_order)
+
+    def option_positions(self):
+        return self.page(self.account.open_contracts(), self.account.option_position)
+
+    def option_instrument(self, option_id):
+        return self.account.option_instrument(_index(option_id), self.base)
+
+    def dividends(self):
+        return self.page(np.arange(len(self.account.dividend_day) - 1, -1, -1), self.account.dividend)
+
+    def positions(self):
+        shares, average = self.account.positions()
+        held = np.flatnonzero(shares > 0) if self.query.get('nonzero') == 'true' else np.arange(len(shares))
+        return self.page(held, lambda i, base: self.account.position(i, shares[i], average[i], base))
+
+    def instruments(self):
+        if 'symbol' in self.query:
+            i = self.account.symbol_index(self.query['symbol'])
+            return {'previous': None, 'next': None, 'results': [self.account.instrument(i, self.base)] if i is not None else []}
+        if 'ids' in self.query:
+            results = []
+            for instrument_id in self.query['ids'].split(','):
+                i = _index(instrument_id)
+                results.append(self.account.instrument(i, self.base) if i < len(self.account.symbols) else None)
+            return {'previous': None, 'next': None, 'results': results}
+        return self.page(np.arange(len(self.account.symbols)), self.account.instrument)
+
+    def instrument(self, instrument_id):
+        return self.account.instrument(_index(instrument_id), self.base)
+
+    def quotes(self):
+        results = []
+        for symbol in self.query.get('symbols', '').split(','):
+            i = self.account.symbol_index(symbol)
+            results.append(self.account.quote(i, self.base) if i is not None else None)
+        return {'results': results}
+
+    def quote(self, symbol):
+        i = self.account.symbol_index(symbol)
+        if i is None:
+            raise NotFound(symbol)
+        return self.account.quote(i, self.base)
+
+    def historicals(self):
+        span_days = {'day': 1, 'week': 7, 'month': 31, '3month': 92, 'year': 365, '5year': 5 * 365}.get(self.query.get('span'), 365)
+        results = []
+        for symbol in self.query.get('symbols', '').split(','):
+            i = self.account.symbol_index(symbol)
+            results.append(self.account.historicals(i, span_days) if i is not None else None)
+        return {'results': results}
+
+    def option_market_data(self):
+        results = []
+        for url in self.query.get('instruments', '').split(','):
+            contract = _index(url.rstrip('/').rsplit('/', 1)[-1])
+            results.append(self.account.option_market_data(contract, self.base) if contract < len(self.account.contract_mark) else None)
+        return {'results': results}
+
+    def option_market_datum(self, option_id):
+        return self.account.option_market_data(_index(option_id), self.base)
+
+    def token(self):
+        return {'access_token': 'mock-access-token', 'refresh_token': 'mock-refresh-token', 'expires_in': 86400,
+                'token_type': 'Bearer', 'scope': 'internal'}
+
+    def logout(self):
+        return {}
+
+
+class MockRobinhood(ThreadingHTTPServer):
+    """HTTP server for one `SyntheticAccount`
+
+        Every request waits `latency` seconds (normally distributed with
+        `jitter`) before it is answered, requests are served concurrently.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, account, host='127.0.0.1', port=DEFAULT_PORT, latency=0.0, jitter=0.0,
+                 page_size=DEFAULT_PAGE_SIZE, quiet=True):
+        """
+            Args:
+                account (:obj:`SyntheticAccount`): account to serve
+                host (str): address to listen on
+                port (int): port to listen on, 0 for any free port
+                latency (float): seconds added to every request
+                jitter (float): standard deviation of the added delay
+                page_size (int): results per page of list endpoints
+                quiet (bool): don't log every request
+        """
+
+        ThreadingHTTPServer.__init__(self, (host, port), MockRequestHandler)
+        self.account = account
+        self.latency = latency
+        self.jitter = jitter
+        self.page_size = page_size
+        self.quiet = quiet
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+    def start(self):
+        """Serve from a background thread, returns the base url to point `ROBINHOOD_API_URL` at """
+
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-robinhood', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", help="serve a saved .npz account instead of synthesizing one")
+    parser.add_argument("--orders", help="equity orders to synthesize", type=int, default=1000)
+    parser.add_argument("--symbols", help="tickers to trade, defaults to about 2 * sqrt(orders)", type=int)
+    parser.add_argument("--dividends", help="dividend records, defaults to orders / 20", type=int)
+    parser.add_argument("--option_orders", help="options orders, defaults to orders / 10", type=int)
+    parser.add_argument("--seed", help="random seed", type=int, default=0)
+    parser.add_argument("--save", help="save the account to this .npz fixture")
+    parser.add_argument("--host", help="address to listen on", default='127.0.0.1')
+    parser.add_argument("--port", help="port to listen on", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", help="seconds added to every request", type=float, default=0.0)
+    parser.add_argument("--jitter", help="standard deviation of the added delay", type=float, default=0.0)
+    parser.add_argument("--page_size", help="results per page", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--verbose", help="log every request", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.fixture:
+        account = SyntheticAccount.load(args.fixture)
+    else:
+        account = synthesize(args.orders, n_symbols=args.symbols, n_dividends=args.dividends,
+                             n_option_orders=args.option_orders, seed=args.seed)
+    if args.save:
+        account.save(args.save)
+
+    server = MockRobinhood(account, host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+                           page_size=args.page_size, quiet=not args.verbose)
+    print("Serving {} orders, {} dividends and {} options orders on {}".format(
+        len(account), len(account.dividend_day), len(account.option_order_time), server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,134 @@
+"""options_engine.py: per-contract options PnL from multi-leg order history """
+
+import numpy as np
+import pandas as pd
+
+
+# Shares per contract, when a position does not say otherwise
+DEFAULT_MULTIPLIER = 100.0
+
+LEG_COLUMNS = ['date', 'order_id', 'ticker', 'option_id', 'side', 'position_effect', 'quantity', 'price']
+
+
+def option_id_from_url(url):
+    return url.rstrip('/').rsplit('/', 1)[-1]
+
+
+def options_legs(options_orders):
+    """Expand options orders into one row per executed leg
+
+        Args:
+            options_orders (:obj:`list` of :obj:`dict`): raw `options/orders` results
+
+        Returns:
+            (:obj:`DataFrame`): `LEG_COLUMNS` plus `cash_flow` (premium in
+                dollars, negative when bought), sorted by date. `price` is the
+                volume-weighted execution price per share of the leg.
+    """
+
+    records = []
+    for order in options_orders:
+        for leg in order.get('legs') or []:
+            executions = leg.get('executions') or []
+            if not executions:
+                continue
+            quantities = [float(execution['quantity']) for execution in executions]
+            quantity = sum(quantities)
+            if quantity <= 0:
+                continue
+            notional = sum(float(execution['price']) * each for execution, each in zip(executions, quantities))
+            records.append((
+                order['created_at'],
+                order['id'],
+                order['chain_symbol'],
+                option_id_from_url(leg['option']),
+                leg['side'],
+                leg['position_effect'],
+                quantity,
+                notional / quantity,
+            ))
+
+    legs = pd.DataFrame.from_records(records, columns=LEG_COLUMNS)
+    legs['date'] = pd.to_datetime(legs['date'], utc=True)
+    legs['quantity'] = legs['quantity'].astype(float)
+    legs['price'] = legs['price'].astype(float)
+
+    sign = np.where(legs['side'].values == 'buy', 1.0, -1.0)
+    legs['signed_quantity'] = sign * legs['quantity'].values
+    legs['cash_flow'] = -legs['signed_quantity'].values * legs['price'].values * DEFAULT_MULTIPLIER
+
+    return legs.sort_values('date', kind='mergesort').reset_index(drop=True)
+
+
+def contract_positions(legs, owned=None):
+    """Quantities and premium per option contract
+
+        Args:
+            legs (:obj:`DataFrame`): as returned by `options_legs`
+            owned (:obj:`list` of :obj:`dict`, optional): `options/positions` results.
+                When given, they decide what is still open: contracts that are
+                not listed have expired or been closed outside of orders.
+
+        Returns:
+            (:obj:`DataFrame`): indexed by `option_id` with `ticker`, `bought`,
+                `sold`, `net_quantity` (from orders), `open_quantity` (signed,
+                short is negative), `multiplier`, `cash_flow` and `n_legs`
+    """
+
+    bought = legs['quantity'].where(legs['side'] == 'buy', 0.0)
+    grouped = legs.assign(bought=bought).groupby('option_id', sort=False)
+
+    positions = pd.DataFrame({
+        'ticker': grouped['ticker'].first(),
+        'bought': grouped['bought'].sum(),
+        'net_quantity': grouped['signed_quantity'].sum(),
+        'cash_flow': grouped['cash_flow'].sum(),
+        'n_legs': grouped.size(),
+    })
+    positions['sold'] = positions['bought'] - positions['net_quantity']
+    positions['multiplier'] = DEFAULT_MULTIPLIER
+
+    if owned is None:
+        positions['open_quantity'] = positions['net_quantity']
+    else:
+        df_owned = pd.DataFrame.from_records(owned, columns=['option_id', 'chain_symbol', 'quantity', 'type', 'trade_value_multiplier'])
+        df_owned['quantity'] = pd.to_numeric(df_owned['quantity'])
+        df_owned['signed_quantity'] = np.where(df_owned['type'].values == 'short', -1.0, 1.0) * df_owned['quantity'].values
+        df_owned = df_owned[df_owned['quantity'] > 0].set_index('option_id')
+
+        # Positions opened outside the available order history still need a row
+        missing = df_owned.index.difference(positions.index)
+        if len(missing) > 0:
+            extra = pd.DataFrame({
+                'ticker': df_owned.loc[missing, 'chain_symbol'],
+                'bought': 0.0, 'sold': 0.0, 'net_quantity': 0.0, 'cash_flow': 0.0, 'n_legs': 0,
+                'multiplier': DEFAULT_MULTIPLIER,
+            }, index=missing)
+            positions = pd.concat([positions, extra])
+
+        positions['open_quantity'] = df_owned['signed_quantity'].reindex(positions.index).fillna(0.0)
+        multiplier = pd.to_numeric(df_owned['trade_value_multiplier']).reindex(positions.index)
+        positions['multiplier'] = multiplier.fillna(DEFAULT_MULTIPLIER)
+
+    positions.index.name = 'option_id'
+    return positions[['ticker', 'bought', 'sold', 'net_quantity', 'open_quantity', 'multiplier', 'cash_flow', 'n_legs']]
+
+
+def mark_contracts(positions, marks):
+    """Value open contracts and total PnL per contract
+
+        Args:
+            positions (:obj:`DataFrame`): as returned by `contract_positions`
+            marks (:obj:`dict`): option id -> mark price per share
+
+        Returns:
+            (:obj:`DataFrame`): `positions` with `mark`, `market_value` and `pnl`.
+                Open contracts without a mark are valued at 0.
+    """
+
+    positions = positions.copy()
+    positions['mark'] = pd.to_numeric(pd.Series(marks, dtype=object).reindex(positions.index))
+    market_value = positions['open_quantity'] * positions['mark'] * positions['multiplier']
+    positions['market_value'] = market_value.where(positions['open_quantity'] != 0, 0.0).fillna(0.0)
+    positions['pnl'] = positions['cash_flow'] + positions['market_value']
+    return positions
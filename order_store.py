@@ -0,0 +1,132 @@
+"""order_store.py: on-disk store of Robinhood order history, synced incrementally """
+
+import json
+import logging
+import sqlite3
+from contextlib import closing
+
+import endpoints
+from paginator import Paginator
+
+
+class OrderStore:
+    """SQLite table of raw order payloads keyed by order `id`
+
+        Filled and cancelled orders never change, so after the first full pull a
+        sync only asks for orders updated since the newest stored
+        `last_transaction_at`, plus a refresh of the orders still in flight.
+    """
+
+    # States an order can still move out of
+    PENDING_STATES = ('unconfirmed', 'queued', 'confirmed', 'partially_filled')
+
+    logger = logging.getLogger('Robinhood')
+    logger.addHandler(logging.NullHandler())
+
+    def __init__(self, path, table='orders', url=None):
+        """
+            Args:
+                path (str): sqlite database file
+                table (str): table name, one per order stream
+                url (str, optional): list endpoint of the stream, defaults to `endpoints.orders()`
+        """
+
+        self.path = path
+        self.table = table
+        self.url = url or endpoints.orders()
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS {} ('
+                'id TEXT PRIMARY KEY, '
+                'last_transaction_at TEXT, '
+                'state TEXT, '
+                'payload TEXT NOT NULL)'.format(self.table)
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def __len__(self):
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT COUNT(*) FROM {}'.format(self.table)).fetchone()[0]
+
+    def last_transaction_at(self):
+        """Newest stored `last_transaction_at`, None if the store is empty """
+
+        with closing(self._connect()) as conn:
+            return conn.execute('SELECT MAX(last_transaction_at) FROM {}'.format(self.table)).fetchone()[0]
+
+    def pending_ids(self):
+        """Ids of stored orders that have not reached a final state """
+
+        placeholders = ','.join('?' * len(self.PENDING_STATES))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                'SELECT id FROM {} WHERE state IN ({})'.format(self.table, placeholders),
+                self.PENDING_STATES,
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def upsert(self, orders):
+        """Insert or replace raw order payloads
+
+            Args:
+                orders (:obj:`list` of :obj:`dict`): orders as returned by the API
+        """
+
+        rows = [
+            (order['id'], order.get('last_transaction_at') or order.get('updated_at'), order.get('state'), json.dumps(order))
+            for order in orders
+        ]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany('INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?)'.format(self.table), rows)
+
+    def orders(self):
+        """All stored orders, newest first
+
+            Returns:
+                (:obj:`list` of :obj:`dict`): raw order payloads
+        """
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                'SELECT payload FROM {} ORDER BY last_transaction_at DESC'.format(self.table)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def sync(self, my_trader, paginator=None):
+        """Bring the store up to date and return every stored order
+
+            Args:
+                my_trader (:obj:`Robinhood`): authenticated client
+                paginator (:obj:`Paginator`, optional): paginator to fetch with
+
+            Returns:
+                (:obj:`list` of :obj:`dict`): raw order payloads, newest first
+        """
+
+        if paginator is None:
+            paginator = Paginator(my_trader)
+
+        since = self.last_transaction_at()
+        pending = self.pending_ids()
+
+        if since is None:
+            fresh = paginator.fetch_all(self.url)
+        else:
+            fresh = paginator.fetch_all(self.url, params={'updated_at[gte]': since})
+
+        # Orders still in flight may have changed without being newer than `since`
+        # One that can't be fetched (e.g. purged) keeps its stored payload and is retried next sync
+        def keep_stored(url, error):
+            self.logger.warning('Failed to refresh pending order %s, keeping the stored one: %r', url, error)
+
+        seen = set(order['id'] for order in fresh)
+        refetched = paginator.fetch_pages([self.url + '{}/'.format(order_id) for order_id in pending if order_id not in seen],
+                                          on_error=keep_stored)
+        fresh.extend(order for order in refetched if order is not None)
+
+        self.upsert(fresh)
+
+        return self.orders()
@@ -0,0 +1,166 @@
+"""paginator.py: concurrent cursor pagination over Robinhood list endpoints """
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from six.moves.urllib.parse import urlparse  # pylint: disable=E0401
+
+from transport import DEFAULT_TIMEOUT
+
+
+class HostRateLimiter:
+    """Spaces out requests so each host sees at most `rate` requests per second """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def reserve(self, url):
+        """Book the next slot for the host of `url`, without waiting
+
+            Args:
+                url (str): url about to be requested
+
+            Returns:
+                (float): seconds to wait before sending it
+        """
+
+        if not self.rate:
+            return 0.0
+
+        host = urlparse(url).netloc
+        interval = 1.0 / self.rate
+
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + interval
+
+        return slot - now
+
+    def wait(self, url):
+        """Block until a request to the host of `url` is allowed
+
+            Args:
+                url (str): url about to be requested
+        """
+
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Paginator:
+    """Walks the `next` cursor of paginated endpoints, several streams at a time
+
+        Pages of a single stream are inherently serial (each cursor lives in the
+        previous page), so the next page is requested as soon as its cursor has
+        been parsed, before the current page is handed to the caller. Independent
+        streams (orders, options orders, dividends, ...) are walked in parallel.
+    """
+
+    def __init__(self, my_trader, max_workers=4, requests_per_second=None, timeout=None):
+        """
+            Args:
+                my_trader (:obj:`Robinhood`): authenticated client, its session is reused
+                max_workers (int): maximum number of requests in flight at once
+                requests_per_second (float, optional): per-host rate limit, None for no limit
+                timeout (float or tuple, optional): request timeout, defaults to the client's
+        """
+
+        self.my_trader = my_trader
+        self.max_workers = max_workers
+        self.timeout = timeout if timeout is not None else getattr(my_trader, 'timeout', DEFAULT_TIMEOUT)
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+    def fetch_page(self, url, params=None):
+        """Fetch a single page, respecting the concurrency and rate limits
+
+            Returns:
+                (:obj:`dict`): JSON payload of the page
+        """
+
+        with self._slots:
+            self.rate_limiter.wait(url)
+            res = self.my_trader.session.get(url, params=params, timeout=self.timeout)
+
+        res.raise_for_status()
+        return res.json()
+
+    def fetch_all(self, url, params=None, on_page=None):
+        """Fetch every page of a paginated endpoint
+
+            Args:
+                url (str): url of the first page
+                params (:obj:`dict`, optional): query params for the first page
+                on_page (callable, optional): called with each page's `results`
+                    while the following page is already being fetched
+
+            Returns:
+                (:obj:`list`): concatenated `results` of every page
+        """
+
+        results = []
+
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            pending = prefetcher.submit(self.fetch_page, url, params)
+
+            while pending is not None:
+                page = pending.result()
+
+                next_url = page.get('next')
+                pending = prefetcher.submit(self.fetch_page, next_url) if next_url else None
+
+                page_results = page.get('results') or []
+                if on_page is not None:
+                    on_page(page_results)
+                results.extend(page_results)
+
+        return results
+
+    def fetch_pages(self, urls, on_error=None):
+        """Fetch several single pages concurrently, at most `max_workers` in flight
+
+            Args:
+                urls (:obj:`list` of str): urls of the pages
+                on_error (callable, optional): called with the url and the exception of a
+                    page that failed, which is then None in the result. By default the
+                    first failure is raised
+
+            Returns:
+                (:obj:`list` of :obj:`dict`): JSON payloads, in the order of `urls`
+        """
+
+        if not urls:
+            return []
+
+        def fetch(url):
+            if on_error is None:
+                return self.fetch_page(url)
+            try:
+                return self.fetch_page(url)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                on_error(url, e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+            return list(executor.map(fetch, urls))
+
+    def fetch_streams(self, urls):
+        """Fetch several paginated endpoints concurrently
+
+            Args:
+                urls (:obj:`dict`): stream name -> url of its first page
+
+            Returns:
+                (:obj:`dict`): stream name -> concatenated `results`
+        """
+
+        with ThreadPoolExecutor(max_workers=max(1, len(urls))) as executor:
+            futures = {name: executor.submit(self.fetch_all, url) for name, url in urls.items()}
+
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,119 @@
+"""pnl_engine.py: vectorized profit-and-loss calculations over order DataFrames """
+
+import numpy as np
+import pandas as pd
+
+
+# Share counts closer to zero than this are float noise from fractional orders
+SHARES_EPSILON = 1e-6
+
+
+def order_flows(df_orders):
+    """Signed share and cash flows of every executed order
+
+        Args:
+            df_orders (:obj:`DataFrame`): orders with `side`, `symbol`, `shares` and `price`
+                columns, as strings or numbers. Orders without a price never executed
+                and are dropped.
+
+        Returns:
+            (:obj:`DataFrame`): `symbol`, `shares`, `price`, `share_flow` (positive
+                for buys) and `cash_flow` (positive for sells)
+    """
+
+    price = pd.to_numeric(df_orders['price'], errors='coerce')
+    executed = price.notnull().values
+
+    flows = pd.DataFrame({
+        'symbol': df_orders['symbol'].values[executed],
+        'shares': pd.to_numeric(df_orders['shares']).values[executed].astype(float),
+        'price': price.values[executed].astype(float),
+    }, index=df_orders.index[executed])
+
+    sign = np.where(df_orders['side'].values[executed] == 'buy', 1.0, -1.0)
+    flows['share_flow'] = sign * flows['shares'].values
+    flows['cash_flow'] = -flows['share_flow'].values * flows['price'].values
+
+    return flows
+
+
+def itemized_pl(df_orders, last_prices):
+    """Net PnL and number of trades per ticker
+
+        Realized cash flows are summed per ticker in one groupby; tickers still
+        held are marked at their last trade price as if sold now (unrealized PnL).
+        Tickers with a negative share count (free gift stocks) get a trailing
+        space appended to their symbol.
+
+        Args:
+            df_orders (:obj:`DataFrame`): orders, see `order_flows`
+            last_prices (callable): list of tickers -> dict of ticker -> last trade price
+
+        Returns:
+            (tuple): :obj:`DataFrame` of `net_pnl` and `n_trades` indexed by `SYMBOL`, best
+                ticker first, and the list of held tickers without a quote, whose open
+                shares are left out of `net_pnl`
+    """
+
+    flows = order_flows(df_orders)
+
+    grouped = flows.groupby('symbol', sort=False).agg(
+        net_shares=('share_flow', 'sum'),
+        net_pnl=('cash_flow', 'sum'),
+        n_trades=('cash_flow', 'size'),
+    )
+    net_shares = grouped['net_shares'].where(grouped['net_shares'].abs() > SHARES_EPSILON, 0.0)
+
+    # Marks for every open position, in one batched lookup
+    held = net_shares > 0
+    open_symbols = list(grouped.index[held])
+    marks = pd.Series(last_prices(open_symbols) if open_symbols else {}, dtype=float)
+    marks = marks.reindex(grouped.index)
+
+    unmarked = list(grouped.index[held & marks.isnull()])
+
+    unrealized = (net_shares * marks).where(held, 0.0).fillna(0.0)
+    grouped['net_pnl'] = (grouped['net_pnl'] + unrealized).round(2)
+
+    gifted = net_shares < 0
+    grouped.index = np.where(gifted, grouped.index.astype(str) + ' ', grouped.index.astype(str))
+    grouped.index.name = 'SYMBOL'
+
+    df_pnl = grouped[['net_pnl', 'n_trades']].sort_values('net_pnl', ascending=False, kind='mergesort')
+    return df_pnl, unmarked
+
+
+REPORT_COLUMNS = ['net_pnl', 'n_trades', 'div_payouts', 'options_pnl']
+
+
+def pnl_report(df_pnl, df_dividends=None, df_options=None):
+    """Join equities, dividends and options PnL into one per-ticker table
+
+        Each source is reduced to one column indexed by ticker and the columns
+        are outer-joined in a single step: tickers from `df_pnl` come first, in
+        their order, followed by tickers that only have dividends or options.
+
+        Args:
+            df_pnl (:obj:`DataFrame`): `net_pnl` and `n_trades` indexed by ticker, see `itemized_pl`
+            df_dividends (:obj:`DataFrame`, optional): dividend records with `ticker` and `amount`
+            df_options (:obj:`DataFrame`, optional): options cash flows with `ticker` and `value`
+
+        Returns:
+            (tuple): the report, indexed by `SYMBOL` with `REPORT_COLUMNS`, and
+                a :obj:`Series` of column totals
+    """
+
+    parts = [df_pnl[['net_pnl', 'n_trades']]]
+
+    if df_dividends is not None:
+        amount = pd.to_numeric(df_dividends['amount'])
+        parts.append(amount.groupby(df_dividends['ticker'].values).sum().rename('div_payouts'))
+
+    if df_options is not None:
+        value = pd.to_numeric(df_options['value'])
+        parts.append(value.groupby(df_options['ticker'].values).sum().rename('options_pnl'))
+
+    report = pd.concat(parts, axis=1, sort=False).reindex(columns=REPORT_COLUMNS)
+    report.index.name = 'SYMBOL'
+
+    return report, report.sum()
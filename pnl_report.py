@@ -0,0 +1,434 @@
+"""pnl_report.py: the profit-and-loss report as a reusable API over an authenticated client """
+
+import asyncio
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import TW_robinhood_scripts as rh
+import AsyncRobinhood
+import endpoints
+import pnl_engine
+import tax_lots
+import options_engine
+import buy_and_hold as benchmark_engine
+from paginator import Paginator
+from order_store import OrderStore
+from instrument_resolver import InstrumentResolver, DEFAULT_CACHE_PATH
+from equity_curve import EquityCurve
+
+
+# Open-ended defaults of the command line, wider than any account history
+DEFAULT_START_DATE = 'January 1, 2012'
+DEFAULT_END_DATE = 'January 1, 2030'
+
+
+@dataclass
+class PnLResult:
+    """Everything one report run computed
+
+        Frames cover `start_date` to `end_date` unless their name says history.
+    """
+
+    start_date: str
+    end_date: str
+    orders: pd.DataFrame
+    equities: pd.DataFrame
+    dividends: pd.DataFrame
+    report: pd.DataFrame
+    totals: pd.Series
+    roi: pd.Series
+    orders_history: pd.DataFrame
+    dividends_history: pd.DataFrame
+    options: Optional[pd.DataFrame] = None
+    options_history: Optional[pd.DataFrame] = None
+    contracts: Optional[pd.DataFrame] = None
+    unmarked_equities: list = field(default_factory=list)
+    unmarked_options: list = field(default_factory=list)
+    options_error: Optional[str] = None
+    realized_lots: Optional[pd.DataFrame] = None
+    open_lots: Optional[pd.DataFrame] = None
+    lots_as_of: Optional[pd.Timestamp] = None
+    benchmark: Optional[pd.DataFrame] = None
+    benchmark_series: Optional[benchmark_engine.PriceSeries] = None
+    benchmark_lump_sum: Optional[float] = None
+    equity_curve: Optional[EquityCurve] = None
+
+    @property
+    def net_pnl(self):
+        return float(self.totals['net_pnl'])
+
+    @property
+    def div_payouts(self):
+        return float(self.totals['div_payouts'])
+
+    @property
+    def options_pnl(self):
+        return float(self.totals['options_pnl'])
+
+    @property
+    def total_pnl(self):
+        return round(self.net_pnl + self.div_payouts + self.options_pnl, 2)
+
+    def summary(self):
+        """(:obj:`dict`): headline numbers, rounded to cents """
+
+        return {
+            'total_pnl': self.total_pnl,
+            'net_pnl': round(self.net_pnl, 2),
+            'div_payouts': round(self.div_payouts, 2),
+            'options_pnl': round(self.options_pnl, 2),
+        }
+
+
+class PnLReport:
+    """Profit-and-loss reports for one logged-in account
+
+        The client, its sessions, the instrument cache and the downloaded
+        histories are kept between runs, so a long-lived caller can report on
+        many date ranges while paying for login and the history pull once.
+        Call `refresh` to download histories again.
+    """
+
+    def __init__(self, my_trader, resolver=None, order_store=None, price_store=None, max_workers=4,
+                 requests_per_second=None, async_client=0, instrument_cache=DEFAULT_CACHE_PATH, marks_ttl=0):
+        """
+            Args:
+                my_trader (:obj:`Robinhood`): authenticated client
+                resolver (:obj:`InstrumentResolver`, optional): instrument cache to share
+                order_store (str or :obj:`OrderStore`, optional): keep orders on disk, only new ones are downloaded.
+                    Options orders are kept in the same file; dividends and open options positions are
+                    downloaded in full every time
+                price_store (:obj:`PriceStore`, optional): daily closes for benchmarks and the equity curve
+                max_workers (int): maximum concurrent requests
+                requests_per_second (float, optional): per-host rate limit
+                async_client (int): 1 to download histories with `AsyncRobinhood`
+                instrument_cache (str): cache file, when `resolver` is not given
+                marks_ttl (float): seconds last trade prices are reused across runs, 0 to quote every run
+        """
+
+        self.my_trader = my_trader
+        self.max_workers = max_workers
+        self.async_client = async_client
+        self.paginator = Paginator(my_trader, max_workers=max_workers, requests_per_second=requests_per_second)
+        # An empty resolver is falsy (it has a length), so test for None
+        self.resolver = resolver if resolver is not None else InstrumentResolver(instrument_cache, my_trader=my_trader, max_workers=max_workers)
+        self.order_store = OrderStore(order_store) if isinstance(order_store, str) else order_store
+        self.options_order_store = None
+        if self.order_store is not None:
+            self.options_order_store = OrderStore(self.order_store.path, table='options_orders', url=endpoints.options_orders())
+        self.price_store = price_store
+        self.marks_ttl = marks_ttl
+        self._histories = {}
+        self._prepared = {}
+        self._marks = {}
+        self._marks_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, options=None):
+        """Download histories again
+
+            Args:
+                options (int, optional): download now (1 with options, 0 without) and swap
+                    the new histories in once ready, so runs in the meantime use the old
+                    ones. By default histories are only forgotten, the next run pulls them.
+        """
+
+        histories = self._download(options) if options is not None else None
+        with self._lock:
+            self._histories = {options: histories} if histories is not None else {}
+            self._prepared = {}
+            self._marks = {}
+
+    def histories(self, options=1):
+        """Orders, dividends and (with `options`) options orders and positions, downloaded once
+
+            Returns:
+                (:obj:`dict`): stream name -> list of records
+        """
+
+        with self._lock:
+            histories = self._histories.get(options) or self._histories.get(1)
+            if histories is None:
+                histories = self._histories[options] = self._download(options)
+            return histories
+
+    def _download(self, options):
+        if self.order_store is not None:
+            histories = rh.get_all_histories(self.my_trader, self.paginator, options=options, order_store=self.order_store,
+                                             options_order_store=self.options_order_store)
+        elif self.async_client == 1:
+            histories = asyncio.run(self._gather_histories_async(options))
+        else:
+            histories = rh.get_all_histories(self.my_trader, self.paginator, options=options)
+
+        # Resolve every instrument up front, so a cold cache costs a few bulk requests
+        self.resolver.resolve_many([each['instrument'] for each in histories['orders'] + histories['dividends']])
+        return histories
+
+    def prepared(self, options=1, histories=None):
+        """Order, dividend and options frames of the whole history, built once per download
+
+            Returns:
+                (:obj:`dict`): `orders`, `order_ids`, `dividends_history`, `dividends` (indexed by record
+                    date) and, with options, `options_legs`, `options_history`, `contracts`,
+                    `unmarked_options` or `options_error`
+        """
+
+        if histories is not None:
+            self.resolver.resolve_many([each['instrument'] for each in histories['orders'] + histories['dividends']])
+            return self._prepare(histories, options)
+
+        histories = self.histories(options)
+        # Frames are kept with the histories they were built from, so frames a run was still
+        # building during a refresh are never served for the new histories
+        with self._lock:
+            built_from, prepared = self._prepared.get(options, (None, None))
+        if built_from is not histories:
+            prepared = self._prepare(histories, options)
+            with self._lock:
+                self._prepared[options] = (histories, prepared)
+        return prepared
+
+    def _prepare(self, histories, options):
+        df_order_history, _ = rh.get_order_history(self.my_trader, past_orders=histories['orders'], resolver=self.resolver)
+        df_orders = df_order_history[['side', 'symbol', 'shares', 'avg_price', 'date', 'state', 'id']]
+        df_orders.columns = ['side', 'symbol', 'shares', 'price', 'date', 'state', 'id']
+
+        df_orders['date'] = pd.to_datetime(df_orders['date'])
+        df_orders = df_orders.sort_values('date')
+        df_orders = df_orders.set_index('date')
+        df_orders['date'] = df_orders.index
+        # Order ids are only needed for specific-ID lot matching, keep them out of the frame
+        order_ids = df_orders.pop('id')
+
+        # Dividends, with their record date as the index
+        df_dividends_history = rh.get_dividends(self.my_trader, dividends=histories['dividends'], resolver=self.resolver)
+        df_dividends = df_dividends_history.copy()
+        df_dividends['record_date'] = pd.to_datetime(df_dividends['record_date'])
+        df_dividends = df_dividends.sort_values('record_date')
+        df_dividends = df_dividends.set_index('record_date')
+        df_dividends['amount'] = pd.to_numeric(df_dividends['amount'])
+
+        prepared = {'orders': df_orders, 'order_ids': order_ids, 'dividends_history': df_dividends_history, 'dividends': df_dividends}
+
+        if options == 1:
+            try:
+                prepared['options_legs'], prepared['options_history'], prepared['contracts'], prepared['unmarked_options'] = self._options(histories)
+            except Exception:
+                prepared['options_error'] = traceback.format_exc()
+
+        return prepared
+
+    def last_prices(self, symbols, marks=None):
+        """Last trade prices, fetched in batches
+
+            Args:
+                symbols (list<str>): tickers
+                marks (:obj:`dict`, optional): prices already known, updated in place.
+                    Defaults to the prices shared across runs, kept `marks_ttl` seconds.
+
+            Returns:
+                (:obj:`dict`): ticker -> price, tickers without a quote are left out
+        """
+
+        if marks is None:
+            with self._lock:
+                if time.time() - self._marks_at > self.marks_ttl:
+                    self._marks = {}
+                    self._marks_at = time.time()
+                marks = self._marks
+
+        missing = [symbol for symbol in symbols if symbol not in marks]
+        if missing:
+            marks.update(self.my_trader.last_trade_prices(missing, max_workers=self.max_workers))
+        return dict((symbol, marks[symbol]) for symbol in symbols if symbol in marks)
+
+    def _marks_on(self, df_orders, symbols, as_of, last_prices):
+        # Today's lots are marked at the last trade price. Past ones at the close of that day when
+        # the price store has it, otherwise at the last price the account traded at on or before it
+        if as_of >= pd.Timestamp.now().normalize():
+            return last_prices(symbols)
+
+        filled = df_orders[df_orders['state'] == 'filled']
+        marks = pd.to_numeric(filled['price']).groupby(filled['symbol']).last().to_dict()
+
+        if self.price_store is not None:
+            self.price_store.update(self.my_trader, symbols, max_workers=self.max_workers)
+            for symbol in symbols:
+                if symbol in self.price_store:
+                    close = self.price_store.close_on(symbol, [as_of])[0]
+                    if not np.isnan(close):
+                        marks[symbol] = close
+
+        return dict((symbol, marks[symbol]) for symbol in symbols if symbol in marks)
+
+    async def _gather_histories_async(self, options):
+        # Every history stream over one shared aiohttp pool, reusing my_trader's auth
+        # with the same concurrency cap and per-host rate limit as the paginator
+        async with AsyncRobinhood.AsyncRobinhood.from_sync(self.my_trader, max_workers=self.max_workers,
+                                                           requests_per_second=self.paginator.rate_limiter.rate) as client:
+            return await AsyncRobinhood.gather_histories(client, options=options)
+
+    def run(self, start_date=None, end_date=None, options=1, lot_method=None, buy_and_hold=0, starting_allocation=5000,
+            benchmark=benchmark_engine.DEFAULT_SERIES_PATH, equity_curve=0, histories=None, specific_lots=None):
+        """Compute the report
+
+            Args:
+                start_date (str, optional): first day, defaults to the first order
+                end_date (str, optional): last day, defaults to today
+                options (int): 1 to include options
+                lot_method (str, optional): one of `tax_lots.LOT_METHODS` to split realized and unrealized PnL
+                specific_lots (:obj:`dict`, optional): for 'specific', sell order id -> list of
+                    (buy order id, quantity), see `tax_lots.match_lots`
+                buy_and_hold (int): 1 to compare with the `benchmark` series
+                starting_allocation (float): dollars put in the benchmark on `start_date`
+                benchmark (str): pickled close series, see `buy_and_hold.load_series`
+                equity_curve (int): 1 to rebuild the daily account value
+                histories (:obj:`dict`, optional): pre-fetched records, see `histories`
+
+            Returns:
+                (:obj:`PnLResult`)
+        """
+
+        start_date = start_date or DEFAULT_START_DATE
+        end_date = end_date or DEFAULT_END_DATE
+        prepared = self.prepared(options, histories)
+
+        # Tax lots need the history from before start_date too
+        df_orders_all = prepared['orders']
+        df_orders = df_orders_all[start_date:end_date]
+
+        if start_date == DEFAULT_START_DATE and len(df_orders):
+            start_date = df_orders.iloc[0]['date'].strftime('%B %d, %Y')
+
+        # Last trade prices, shared by every step that marks positions
+        marks = {} if self.marks_ttl <= 0 else None
+        def last_prices(symbols):
+            return self.last_prices(symbols, marks)
+
+        # Per-ticker PnL, marking open positions with batched quotes
+        df_pnl, unmarked_equities = pnl_engine.itemized_pl(df_orders, last_prices)
+
+        result = dict((name, prepared[name]) for name in ('options_history', 'contracts', 'unmarked_options', 'options_error') if name in prepared)
+
+        # Realized vs unrealized split from the lots matched up to end_date, open lots marked on that day
+        if lot_method is not None:
+            df_lots_orders = df_orders_all[:end_date]
+            order_ids = prepared['order_ids'].values[:len(df_lots_orders)]
+            realized_lots, open_lots = tax_lots.match_lots(df_lots_orders.assign(id=order_ids), lot_method, specific_lots)
+            as_of = min(pd.Timestamp(end_date).normalize(), pd.Timestamp.now().normalize())
+            result['realized_lots'] = tax_lots.realized_between(realized_lots, start_date, end_date)
+            result['open_lots'] = tax_lots.unrealized_pl(open_lots, self._marks_on(df_lots_orders, list(open_lots['symbol'].unique()), as_of, last_prices))
+            result['lots_as_of'] = as_of
+
+        df_dividends_all = prepared['dividends']
+        df_dividends = df_dividends_all[start_date:end_date]
+
+        df_options_legs = prepared.get('options_legs')
+        df_options = prepared['options_history'][start_date:end_date] if 'options_history' in prepared else None
+
+        # Daily value of the account over its whole history, windowed to the requested dates
+        if equity_curve == 1:
+            if self.price_store is not None:
+                self.price_store.update(self.my_trader, df_orders_all['symbol'].unique(), max_workers=self.max_workers)
+            result['equity_curve'] = EquityCurve.from_history(df_orders_all, self.price_store, df_dividends_all, result.get('options_history'))
+
+        # Join equities, dividends and options per ticker, and total every column at once
+        report, totals = pnl_engine.pnl_report(df_pnl, df_dividends, df_options)
+
+        roi = self._roi(df_orders, df_options_legs, totals, start_date, end_date)
+
+        if buy_and_hold == 1:
+            result.update(self._benchmark(df_orders, benchmark, starting_allocation, start_date, end_date))
+
+        return PnLResult(
+            start_date=start_date,
+            end_date=end_date,
+            orders=df_orders,
+            equities=df_pnl,
+            dividends=df_dividends,
+            report=report,
+            totals=totals,
+            roi=roi,
+            orders_history=df_orders_all,
+            dividends_history=prepared['dividends_history'],
+            options=df_options,
+            unmarked_equities=unmarked_equities,
+            **result
+        )
+
+    def _options(self, histories):
+        # Every leg of every options order, netted per contract
+        df_options_legs = options_engine.options_legs(histories['options_orders'])
+        owned = histories.get('options_owned')
+        if owned is None:
+            owned = self.paginator.fetch_all(endpoints.options_base() + "positions/?nonzero=true")
+            histories['options_owned'] = owned
+        df_contracts = options_engine.contract_positions(df_options_legs, owned)
+
+        # Marks for the contracts still open, in a few batched market data requests
+        open_ids = list(df_contracts.index[df_contracts['open_quantity'] != 0])
+        market_data = self.my_trader.get_options_market_data(open_ids, max_workers=self.max_workers)
+        marks = dict((option_id, data.get('adjusted_mark_price')) for option_id, data in market_data.items())
+        unmarked = [option_id for option_id in open_ids if marks.get(option_id) is None]
+
+        df_contracts = options_engine.mark_contracts(df_contracts, marks)
+
+        # Premium paid and received per leg, plus what is still open valued as of now
+        df_options_orders_history = df_options_legs.set_index('date')[['ticker', 'cash_flow', 'position_effect']]
+        df_options_orders_history = df_options_orders_history.rename(columns={'cash_flow': 'value'})
+
+        still_open = df_contracts[df_contracts['open_quantity'] != 0]
+        pending_options = pd.DataFrame({
+            'ticker': still_open['ticker'].values,
+            'value': still_open['market_value'].values,
+            'position_effect': 'pending',
+        }, index=pd.DatetimeIndex([pd.Timestamp.now(tz='UTC')] * len(still_open), name='date'))
+
+        return df_options_legs, pd.concat([df_options_orders_history, pending_options]), df_contracts, unmarked
+
+    def _roi(self, df_orders, df_options_legs, totals, start_date, end_date):
+        # Capital deployed: every filled buy, and every options premium paid, in the date range
+        long_entries = df_orders[(df_orders['side'] == 'buy') & (df_orders['state'] == 'filled')]
+        starting_stock_investment = (pd.to_numeric(long_entries['price']) * pd.to_numeric(long_entries['shares'])).sum()
+
+        starting_options_investment = 0.0
+        if df_options_legs is not None:
+            option_flows = df_options_legs.set_index('date')['cash_flow'][start_date:end_date]
+            starting_options_investment = -option_flows[option_flows < 0].sum()
+
+        pnl = float(totals['net_pnl'])
+        options_pnl = float(totals['options_pnl'])
+
+        return pd.Series({
+            'stocks': rh.pct_change(pnl + starting_stock_investment, starting_stock_investment),
+            'options': rh.pct_change(options_pnl + starting_options_investment, starting_options_investment),
+            'overall': rh.pct_change(
+                options_pnl + starting_options_investment + pnl + starting_stock_investment,
+                starting_options_investment + starting_stock_investment),
+        }, name='roi')
+
+    def _benchmark(self, df_orders, benchmark, starting_allocation, start_date, end_date):
+        # Same cash flows, same dates, invested in the benchmark instead
+        series = benchmark_engine.load_series(benchmark)
+        if self.price_store is not None:
+            # Seed the store from the bundled series once, then only fetch the days since
+            if series.name not in self.price_store:
+                self.price_store.import_frame(series.name, pd.read_pickle(benchmark))
+            self.price_store.update(self.my_trader, [series.name])
+            series = self.price_store.price_series(series.name)
+
+        as_of = min(pd.Timestamp(end_date), pd.Timestamp.now())
+        flows = benchmark_engine.equity_cash_flows(df_orders)
+
+        return {
+            'benchmark': benchmark_engine.replay(series, flows.index, flows.values, as_of=as_of),
+            'benchmark_series': series,
+            'benchmark_lump_sum': benchmark_engine.lump_sum_pnl(series, starting_allocation, start_date, as_of),
+        }
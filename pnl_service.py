@@ -0,0 +1,337 @@
+"""pnl_service.py: keep accounts warm in memory and answer PnL queries over HTTP
+
+    Accounts are read from the same JSON list as `run_accounts.py`. Each one
+    keeps its logged-in `Robinhood` client, its order store and its parsed
+    histories in memory; the instrument cache is shared by every account.
+    Histories are refreshed in the background every `refresh_interval`
+    seconds and queries keep using the previous histories until the new ones
+    are ready. Equity and options orders sync incrementally, only new and
+    pending ones are downloaded; dividends and open options positions are
+    downloaded in full on every refresh.
+
+        GET  /health                                   service status
+        GET  /accounts                                 accounts and their last refresh
+        GET  /pnl?account=alice&start_date=2018-01-01&end_date=2018-12-31&lots=fifo&detail=1
+        POST /refresh?account=alice                    refresh now, every account without `account`
+
+    Set `ROBINHOOD_API_URL` to point every request at a stand-in server.
+"""
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+import Robinhood
+from instrument_resolver import InstrumentResolver, DEFAULT_CACHE_PATH
+from pnl_report import PnLReport
+from run_accounts import check_file_name
+
+
+DEFAULT_PORT = 8765
+DEFAULT_STATE_DIR = 'pnl_service'
+
+
+def jsonable(value):
+    """Plain JSON types for pandas and numpy values, NaN becomes null """
+
+    if isinstance(value, dict):
+        return dict((str(key), jsonable(each)) for key, each in value.items())
+    if isinstance(value, (list, tuple)):
+        return [jsonable(each) for each in value]
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def records(df):
+    """Rows of a DataFrame as JSON-ready dicts, index included """
+
+    return jsonable(df.reset_index().to_dict('records'))
+
+
+class PnLService:
+    """Warm `PnLReport`s for many accounts, refreshed on a schedule """
+
+    def __init__(self, accounts, state_dir=DEFAULT_STATE_DIR, refresh_interval=300, options=1, max_workers=4,
+                 marks_ttl=60, instrument_cache=DEFAULT_CACHE_PATH):
+        """
+            Args:
+                accounts (:obj:`list` of :obj:`dict`): `name`, `username`, `password` and `access_token` per account
+                state_dir (str): directory for each account's order store
+                refresh_interval (float): seconds between background refreshes
+                options (int): 1 to include options trades
+                max_workers (int): concurrent requests per account
+                marks_ttl (float): seconds last trade prices are reused between queries
+                instrument_cache (str): instrument cache shared by every account
+        """
+
+        for account in accounts:
+            check_file_name(account.get('name'))
+        names = [account['name'] for account in accounts]
+        if len(set(names)) != len(names):
+            raise ValueError('Account names must be unique, they name the order stores')
+
+        os.makedirs(state_dir, exist_ok=True)
+
+        self.state_dir = state_dir
+        self.refresh_interval = refresh_interval
+        self.options = options
+        self.max_workers = max_workers
+        self.marks_ttl = marks_ttl
+        self.resolver = InstrumentResolver(instrument_cache, max_workers=max_workers)
+        self.reports = {}
+        self.refreshed = {}
+        self.started_at = time.time()
+
+        # One refresh at a time, they share the instrument cache
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        for account in accounts:
+            self.add_account(account)
+
+    def add_account(self, account):
+        """Log an account in and keep its report
+
+            Args:
+                account (:obj:`dict`): `name`, `username`, `password` and `access_token`
+        """
+
+        my_trader = Robinhood.Robinhood()
+        logged_in = my_trader.set_oath_access_token(account.get('username'), account.get('password'), account.get('access_token'))
+        if not logged_in:
+            my_trader.login(username=account.get('username'), password=account.get('password'))
+
+        # Unknown instruments are looked up with the first account's session
+        if self.resolver.my_trader is None:
+            self.resolver.my_trader = my_trader
+
+        name = account['name']
+        self.reports[name] = PnLReport(
+            my_trader,
+            resolver=self.resolver,
+            order_store=os.path.join(self.state_dir, name + '.sqlite'),
+            max_workers=self.max_workers,
+            marks_ttl=self.marks_ttl,
+        )
+        self.refreshed[name] = {'status': 'pending', 'refreshed_at': None, 'seconds': None, 'error': None}
+
+    def report(self, name):
+        if name not in self.reports:
+            raise KeyError('Unknown account {}'.format(name))
+        return self.reports[name]
+
+    def refresh(self, name=None):
+        """Download new orders, dividends and options, then swap them in
+
+            A failed refresh keeps the previous histories and records the error.
+
+            Args:
+                name (str, optional): account to refresh, every account by default
+
+            Returns:
+                (:obj:`dict`): account -> refresh status
+        """
+
+        names = [name] if name is not None else list(self.reports)
+        reports = [(each, self.report(each)) for each in names]
+
+        with self._refresh_lock:
+            for each, report in reports:
+                started = time.time()
+                try:
+                    report.refresh(self.options)
+                    # Parse the new histories now, not on the first query
+                    report.prepared(self.options)
+                    self.refreshed[each] = {'status': 'ok', 'refreshed_at': pd.Timestamp.now().isoformat(),
+                                            'seconds': round(time.time() - started, 3), 'error': None}
+                except Exception as e:
+                    traceback.print_exc()
+                    self.refreshed[each] = dict(self.refreshed[each], status='failed', error=repr(e))
+
+        return dict((each, self.refreshed[each]) for each in names)
+
+    def start(self):
+        """Refresh every account, then keep refreshing in a background thread """
+
+        self.refresh()
+
+        def loop():
+            while not self._stop.wait(self.refresh_interval):
+                self.refresh()
+
+        self._thread = threading.Thread(target=loop, name='pnl-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def query(self, name, start_date=None, end_date=None, lot_method=None, detail=0):
+        """PnL of one account between two dates, from the histories in memory
+
+            Args:
+                name (str): account name
+                start_date (str, optional): begin date for calculations
+                end_date (str, optional): end date for calculations
+                lot_method (str, optional): also split realized and unrealized PnL, see `tax_lots.LOT_METHODS`
+                detail (int): 1 to include the per-ticker report
+
+            Returns:
+                (:obj:`dict`): JSON-ready totals, ROI and (with `detail`) per-ticker rows
+        """
+
+        started = time.time()
+        report = self.report(name)
+        for date in (start_date, end_date):
+            if date is not None:
+                pd.Timestamp(date)
+
+        result = report.run(start_date=start_date, end_date=end_date, options=self.options, lot_method=lot_method)
+
+        response = {
+            'account': name,
+            'start_date': result.start_date,
+            'end_date': result.end_date,
+            'totals': result.summary(),
+            'roi': result.roi.to_dict(),
+            'refreshed_at': self.refreshed[name]['refreshed_at'],
+        }
+        if result.options_error is not None:
+            response['options_error'] = result.options_error
+        if result.unmarked_equities:
+            response['unmarked_equities'] = result.unmarked_equities
+        if lot_method is not None:
+            response['realized_pnl'] = round(result.realized_lots['realized_pnl'].sum(), 2)
+            response['unrealized_pnl'] = round(result.open_lots['unrealized_pnl'].sum(), 2)
+            response['unrealized_as_of'] = result.lots_as_of
+        if detail == 1:
+            response['report'] = records(result.report)
+        response['milliseconds'] = round((time.time() - started) * 1000, 1)
+
+        return jsonable(response)
+
+
+class PnLRequestHandler(BaseHTTPRequestHandler):
+    """JSON endpoints of a `PnLService`, set on the server as `server.service` """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        service = self.server.service
+
+        if url.path == '/health':
+            return self.reply({'status': 'ok', 'accounts': len(service.reports), 'uptime': round(time.time() - service.started_at, 1)})
+        if url.path == '/accounts':
+            return self.reply(service.refreshed)
+        if url.path == '/pnl':
+            return self.answer(lambda: service.query(
+                query.get('account') or self.only_account(),
+                start_date=query.get('start_date'),
+                end_date=query.get('end_date'),
+                lot_method=query.get('lots'),
+                detail=int(query.get('detail', 0)),
+            ))
+        self.reply({'error': 'Not found'}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+
+        if url.path == '/refresh':
+            return self.answer(lambda: self.server.service.refresh(query.get('account')))
+        self.reply({'error': 'Not found'}, 404)
+
+    def only_account(self):
+        names = list(self.server.service.reports)
+        if len(names) != 1:
+            raise ValueError('Pass account=, this service has {} accounts'.format(len(names)))
+        return names[0]
+
+    def answer(self, compute):
+        try:
+            self.reply(compute())
+        except KeyError as e:
+            self.reply({'error': str(e.args[0] if e.args else e)}, 404)
+        except ValueError as e:
+            self.reply({'error': str(e)}, 400)
+        except Exception as e:
+            traceback.print_exc()
+            self.reply({'error': repr(e)}, 500)
+
+    def reply(self, data, status=200):
+        body = json.dumps(jsonable(data)).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def serve(service, host='127.0.0.1', port=DEFAULT_PORT, quiet=False):
+    """Start `service` and answer requests until interrupted """
+
+    server = ThreadingHTTPServer((host, port), PnLRequestHandler)
+    server.service = service
+    server.quiet = quiet
+    server.daemon_threads = True
+
+    service.start()
+    print("Serving PnL for {} account(s) on http://{}:{}".format(len(service.reports), host, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("accounts", help="JSON file with a list of accounts (name, username, password, access_token)")
+    parser.add_argument("--host", help="address to listen on", default='127.0.0.1')
+    parser.add_argument("--port", help="port to listen on", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--refresh_interval", help="seconds between history refreshes", type=float, default=300)
+    parser.add_argument("--state_dir", help="directory for each account's order store", default=DEFAULT_STATE_DIR)
+    parser.add_argument("--options", help="include options trades, 1 or 0", type=int, default=1)
+    parser.add_argument("--max_workers", help="maximum concurrent requests per account", type=int, default=4)
+    parser.add_argument("--marks_ttl", help="seconds last trade prices are reused between queries", type=float, default=60)
+    parser.add_argument("--instrument_cache", help="instrument cache shared by every account", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--quiet", help="don't log every request", action="store_true")
+
+    args = parser.parse_args()
+
+    with open(args.accounts) as accounts_file:
+        accounts = json.load(accounts_file)
+
+    service = PnLService(
+        accounts,
+        state_dir=args.state_dir,
+        refresh_interval=args.refresh_interval,
+        options=args.options,
+        max_workers=args.max_workers,
+        marks_ttl=args.marks_ttl,
+        instrument_cache=args.instrument_cache,
+    )
+    serve(service, host=args.host, port=args.port, quiet=args.quiet)
@@ -0,0 +1,227 @@
+"""price_store.py: on-disk daily candles per symbol, filled from `get_historical_quotes` """
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from buy_and_hold import PriceSeries, to_days
+
+
+DEFAULT_STORE_PATH = 'price_store'
+
+# One row per trading day, stored as a single structured .npy file per symbol
+CANDLE_DTYPE = np.dtype([
+    ('date', 'datetime64[D]'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'f8'),
+])
+
+# `historicals` spans for daily candles, shortest first, with the days each one covers
+SPANS = [('year', 365), ('5year', 5 * 365)]
+
+
+class PriceStore:
+    """Daily OHLCV candles kept as memory-mapped numpy arrays, one file per symbol
+
+        `update` downloads only the span needed to cover the days since the
+        last stored candle and merges them in; everything else reads from disk.
+        Files are replaced atomically, so a reader never sees a partial write.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        """
+            Args:
+                path (str): directory holding the `<SYMBOL>.npy` files, created if missing
+        """
+
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, symbol):
+        return os.path.join(self.path, symbol.upper() + '.npy')
+
+    def symbols(self):
+        return sorted(name[:-len('.npy')] for name in os.listdir(self.path) if name.endswith('.npy'))
+
+    def __contains__(self, symbol):
+        return os.path.exists(self._file(symbol))
+
+    def candles(self, symbol):
+        """Every stored candle of `symbol`
+
+            Returns:
+                (:obj:`ndarray`): read-only memory-mapped `CANDLE_DTYPE` array sorted
+                    by date, empty if nothing is stored
+        """
+
+        if symbol not in self:
+            return np.zeros(0, dtype=CANDLE_DTYPE)
+        return np.load(self._file(symbol), mmap_mode='r')
+
+    def last_date(self, symbol):
+        candles = self.candles(symbol)
+        return pd.Timestamp(candles['date'][-1]) if len(candles) else None
+
+    def append(self, symbol, candles):
+        """Merge candles into the store, newer data wins on days already stored
+
+            Args:
+                symbol (str): ticker
+                candles (:obj:`ndarray`): `CANDLE_DTYPE` rows, any order
+
+            Returns:
+                (int): number of stored candles
+        """
+
+        candles = np.asarray(candles, dtype=CANDLE_DTYPE)
+        stored = np.array(self.candles(symbol))
+        merged = np.concatenate([stored, candles])
+
+        # Keep the last occurrence of every date: reverse, take the first unique, sort back
+        _, last = np.unique(merged['date'][::-1], return_index=True)
+        merged = merged[len(merged) - 1 - last]
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix='.prices-', suffix='.npy')
+        os.close(fd)
+        try:
+            np.save(tmp_path, merged)
+            os.replace(tmp_path, self._file(symbol))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        return len(merged)
+
+    def import_frame(self, symbol, df, column='close'):
+        """Store a series of closes, e.g. the bundled `data/QQQ_close` pickle
+
+            Args:
+                symbol (str): ticker to store it as
+                df (:obj:`DataFrame` or :obj:`Series`): closes indexed by date
+                column (str): column holding the close, when `df` is a DataFrame
+        """
+
+        closes = df[column] if isinstance(df, pd.DataFrame) else df
+        closes = pd.to_numeric(closes, errors='coerce').dropna()
+
+        candles = np.full(len(closes), np.nan, dtype=CANDLE_DTYPE)
+        candles['date'] = pd.to_datetime(closes.index).values.astype('datetime64[D]')
+        candles['close'] = closes.values
+        return self.append(symbol, candles)
+
+    def range(self, symbol, start=None, end=None):
+        """Candles of `symbol` between two dates (inclusive), without any request
+
+            Returns:
+                (:obj:`DataFrame`): `open`, `high`, `low`, `close` and `volume` indexed by `date`
+        """
+
+        candles = self.candles(symbol)
+        dates = candles['date']
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start).date(), 'D'), side='left')
+        hi = len(dates) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end).date(), 'D'), side='right')
+
+        rows = candles[lo:hi]
+        df = pd.DataFrame({name: np.array(rows[name]) for name in CANDLE_DTYPE.names[1:]},
+                          index=pd.DatetimeIndex(np.array(rows['date']), name='date'))
+        return df
+
+    def close_on(self, symbol, dates):
+        """Last stored close at or before each of `dates`
+
+            Returns:
+                (:obj:`ndarray`): closes, NaN before the first stored candle
+        """
+
+        candles = self.candles(symbol)
+        days = to_days(dates)
+        if not len(candles):
+            return np.full(len(days), np.nan)
+
+        positions = np.searchsorted(candles['date'], days, side='right') - 1
+        closes = np.asarray(candles['close'])[np.maximum(positions, 0)]
+        return np.where(positions >= 0, closes, np.nan)
+
+    def price_series(self, symbol):
+        """Stored closes as a `buy_and_hold.PriceSeries`, e.g. to benchmark against """
+
+        candles = self.candles(symbol)
+        return PriceSeries(np.array(candles['date']), np.array(candles['close']), name=symbol.upper())
+
+    def update(self, my_trader, symbols, chunk_size=50, max_workers=4, today=None):
+        """Download the daily candles missing since the last stored one
+
+            Symbols are grouped by the shortest `historicals` span covering their
+            gap and requested `chunk_size` symbols at a time. Symbols already
+            up to date are skipped.
+
+            Args:
+                my_trader (:obj:`Robinhood`): client to download with
+                symbols (iterable of str): tickers
+                chunk_size (int): symbols per `historicals` request
+                max_workers (int): requests in flight at once
+                today (date, optional): reference date for the gap, defaults to now
+
+            Returns:
+                (:obj:`dict`): symbol -> number of candles received
+        """
+
+        today = pd.Timestamp(today or pd.Timestamp.now()).normalize()
+
+        by_span = {}
+        for symbol in dict.fromkeys(symbol.upper() for symbol in symbols):
+            last = self.last_date(symbol)
+            gap = (today - last).days if last is not None else None
+            if gap is not None and gap < 1:
+                continue
+            span = next((name for name, days in SPANS if gap is not None and gap <= days), SPANS[-1][0])
+            by_span.setdefault(span, []).append(symbol)
+
+        requests = []
+        for span, span_symbols in by_span.items():
+            for i in range(0, len(span_symbols), chunk_size):
+                requests.append((span, span_symbols[i:i + chunk_size]))
+
+        def fetch(request):
+            span, chunk = request
+            return my_trader.get_historical_quotes(chunk, 'day', span).get('results') or []
+
+        received = {}
+        if not requests:
+            return received
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(requests)))) as executor:
+            for results in executor.map(fetch, requests):
+                for result in results:
+                    if not result:
+                        continue
+                    candles = candles_from_historicals(result.get('historicals') or [])
+                    if len(candles):
+                        self.append(result['symbol'], candles)
+                    received[result['symbol']] = len(candles)
+
+        return received
+
+
+def candles_from_historicals(historicals):
+    """`historicals` endpoint rows as a `CANDLE_DTYPE` array
+
+        Interpolated candles (days the symbol did not trade) are dropped.
+    """
+
+    rows = [each for each in historicals if not each.get('interpolated')]
+    candles = np.zeros(len(rows), dtype=CANDLE_DTYPE)
+    if not rows:
+        return candles
+
+    candles['date'] = pd.to_datetime([each['begins_at'] for each in rows], utc=True).tz_convert(None).values.astype('datetime64[D]')
+    for name in ('open', 'high', 'low', 'close'):
+        candles[name] = [float(each[name + '_price']) for each in rows]
+    candles['volume'] = [float(each.get('volume') or 0) for each in rows]
+    return candles
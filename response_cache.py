@@ -0,0 +1,192 @@
+"""response_cache.py: TTL + LRU cache for read-only Robinhood responses """
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+from six.moves.urllib.parse import urlencode, urlparse  # pylint: disable=E0401
+
+
+# (url path pattern, seconds to keep) - first match wins, urls matching none are never cached
+DEFAULT_TTLS = [
+    (r'/instruments/[^/?]+/popularity/', 15 * 60),
+    (r'/options/instruments/', 60 * 60),
+    (r'/options/chains/', 24 * 60 * 60),
+    (r'/instruments/', 24 * 60 * 60),
+    (r'/fundamentals/', 60 * 60),
+    (r'/quotes/historicals/', 15 * 60),
+]
+
+
+class SQLiteBackend:
+    """Keeps cache entries in a sqlite file, so they outlive the process """
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, expires_at REAL, etag TEXT, body TEXT NOT NULL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        with closing(self._connect()) as conn:
+            row = conn.execute('SELECT expires_at, etag, body FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def set(self, key, expires_at, etag, data):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)', (key, expires_at, etag, json.dumps(data)))
+
+    def delete(self, key):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def clear(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute('DELETE FROM responses')
+
+
+class ResponseCache:
+    """In-memory LRU of JSON responses with per-endpoint TTLs
+
+        Entries are kept until their TTL runs out. An expired entry that came
+        with an ETag is kept around, so the next request can revalidate it with
+        If-None-Match instead of downloading it again.
+    """
+
+    def __init__(self, ttls=None, max_entries=2048, backend=None):
+        """
+            Args:
+                ttls (:obj:`list`, optional): (url regex, seconds) rules, defaults to `DEFAULT_TTLS`
+                max_entries (int): entries kept in memory, least recently used are evicted first
+                backend (optional): second-level store such as `SQLiteBackend`
+        """
+
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (DEFAULT_TTLS if ttls is None else ttls)]
+        self.max_entries = max_entries
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, params=None):
+        if params:
+            url += ('&' if '?' in url else '?') + urlencode(sorted(params.items()))
+        return url
+
+    def ttl_for(self, url):
+        """Seconds a response from `url` may be reused, None if it must not be cached """
+
+        path = urlparse(url).path
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        return None
+
+    def lookup(self, key):
+        """Cached entry for `key`
+
+            Returns:
+                (tuple): (is_fresh, etag, data), or None on a miss
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None and self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None:
+                self._remember(key, entry)
+
+        if entry is None:
+            return None
+
+        expires_at, etag, data = entry
+        if expires_at > time.time():
+            return True, etag, data
+        if etag:
+            return False, etag, data
+
+        self.delete(key)
+        return None
+
+    def store(self, key, ttl, data, etag=None):
+        entry = (time.time() + ttl, etag, data)
+        self._remember(key, entry)
+        if self.backend is not None:
+            self.backend.set(key, *entry)
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def get(self, session, url, params=None, timeout=None, raise_for_status=False):
+        """GET `url` through the cache
+
+            Args:
+                session (:obj:`requests.Session`): session to fetch with on a miss
+                url (str): url to fetch
+                params (:obj:`dict`, optional): query params
+                timeout (optional): request timeout
+                raise_for_status (bool): raise `requests.HTTPError` on an error response
+
+            Returns:
+                (:obj:`dict`): JSON contents of the response. Only 200 responses are stored.
+        """
+
+        ttl = self.ttl_for(url)
+        if ttl is None:
+            res = session.get(url, params=params, timeout=timeout)
+            if raise_for_status:
+                res.raise_for_status()
+            return res.json()
+
+        key = self.key(url, params)
+        cached = self.lookup(key)
+
+        headers = None
+        if cached is not None:
+            is_fresh, etag, data = cached
+            if is_fresh:
+                return data
+            headers = {'If-None-Match': etag}
+
+        res = session.get(url, params=params, timeout=timeout, headers=headers)
+
+        if res.status_code == 304 and cached is not None:
+            self.store(key, ttl, cached[2], cached[1])
+            return cached[2]
+
+        if raise_for_status:
+            res.raise_for_status()
+        data = res.json()
+        if res.status_code == 200:
+            self.store(key, ttl, data, res.headers.get('ETag'))
+        return data
@@ -0,0 +1,162 @@
+"""run_accounts.py: run the profit-and-loss report for many accounts in parallel
+
+    Accounts are read from a JSON list, one object per account:
+
+        [
+            {"name": "alice", "username": "...", "password": "...", "access_token": "..."},
+            {"name": "bob", "username": "...", "password": "...", "access_token": "...", "lot_method": "fifo"}
+        ]
+
+    Extra keys are passed to `rh_profit_and_loss` for that account only, except
+    `RESERVED_KEYS`. Each account runs in its own process and writes its files,
+    and what it prints, to `<output_dir>/<name>/`, so a name must be a plain
+    directory name. The instrument cache is shared by every account.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from instrument_resolver import DEFAULT_CACHE_PATH
+
+
+SUMMARY_COLUMNS = ['status', 'total_pnl', 'net_pnl', 'div_payouts', 'options_pnl', 'error']
+# Set for every account by the runner, an account can't override them
+RESERVED_KEYS = ('output_dir', 'instrument_cache')
+
+
+def check_file_name(name, what='Account name'):
+    """Raise ValueError unless `name` is a single path component, so joining it never leaves its directory """
+
+    if not isinstance(name, str) or name in ('', '.', '..') or os.path.isabs(name) \
+            or any(sep in name for sep in (os.sep, os.altsep, '/') if sep):
+        raise ValueError('{} {!r} must be a plain file name, without path separators'.format(what, name))
+
+
+def check_account(account):
+    """Raise ValueError for an account that would write outside its directory
+
+        Args:
+            account (:obj:`dict`): `name` plus `rh_profit_and_loss` arguments
+    """
+
+    check_file_name(account.get('name'))
+    reserved = [key for key in RESERVED_KEYS if key in account]
+    if reserved:
+        raise ValueError('Account {} sets {}, which are set for every account'.format(account['name'], ', '.join(reserved)))
+    if account.get('order_store'):
+        check_file_name(account['order_store'], what='Order store')
+
+
+def run_account(account, output_dir, **kwargs):
+    """Run one account's report, in the calling process
+
+        Args:
+            account (:obj:`dict`): `name` plus `rh_profit_and_loss` arguments
+            output_dir (str): parent directory, the account writes in `output_dir/name`
+            **kwargs: arguments shared by every account
+
+        Returns:
+            (tuple): account name and a summary dict with `SUMMARY_COLUMNS`
+    """
+
+    # Imported here so a worker only pays for it once it actually runs a report
+    import get_profit_and_loss
+
+    check_account(account)
+    account = dict(account)
+    name = account.pop('name')
+    account_dir = os.path.join(output_dir, name)
+    os.makedirs(account_dir, exist_ok=True)
+
+    options = dict(kwargs, **account)
+    if options.get('order_store'):
+        options['order_store'] = os.path.join(account_dir, options['order_store'])
+
+    with open(os.path.join(account_dir, 'report.txt'), 'w') as report, contextlib.redirect_stdout(report):
+        try:
+            totals = get_profit_and_loss.rh_profit_and_loss(output_dir=account_dir, **options)
+            return name, dict(totals, status='ok', error=None)
+        except Exception as e:
+            print(traceback.format_exc())
+            return name, {'status': 'failed', 'error': repr(e)}
+
+
+def run_accounts(accounts, output_dir='reports', processes=None, **kwargs):
+    """Run every account's report, `processes` at a time
+
+        Args:
+            accounts (:obj:`list` of :obj:`dict`): see `run_account`
+            output_dir (str): one sub-directory per account is created in it
+            processes (int, optional): worker processes, defaults to the number of CPUs
+            **kwargs: `rh_profit_and_loss` arguments shared by every account
+
+        Returns:
+            (:obj:`DataFrame`): `SUMMARY_COLUMNS` indexed by account name, in input order
+    """
+
+    # Fail before any report runs
+    for account in accounts:
+        check_account(account)
+    if kwargs.get('order_store'):
+        check_file_name(kwargs['order_store'], what='Order store')
+    names = [account['name'] for account in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError('Account names must be unique, they name the output directories')
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(run_account, account, output_dir, **kwargs) for account in accounts]
+        for future in as_completed(futures):
+            name, summary = future.result()
+            results[name] = summary
+            print("{}: {}".format(name, summary['status'] if summary['status'] != 'ok' else "total PnL ${}".format(summary['total_pnl'])))
+
+    summary = pd.DataFrame.from_dict(results, orient='index').reindex(index=names, columns=SUMMARY_COLUMNS)
+    summary.index.name = 'account'
+    return summary
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("accounts", help="JSON file with a list of accounts (name, username, password, access_token)")
+    parser.add_argument("--output_dir", help="directory for the reports, one sub-directory per account", default="reports")
+    parser.add_argument("--processes", help="accounts to run at once", type=int)
+    parser.add_argument("--start_date", help="begin date for calculations", default='January 1, 2012')
+    parser.add_argument("--end_date", help="end date for calculations", default='January 1, 2030')
+    parser.add_argument("--csv", help="save csvs for every account", action="store_true")
+    parser.add_argument("--pickle", help="save pickles for every account", action="store_true")
+    parser.add_argument("--max_workers", help="maximum concurrent requests per account", type=int, default=4)
+    parser.add_argument("--order_store", help="sqlite file name for each account's order history, kept in its directory")
+    parser.add_argument("--instrument_cache", help="instrument cache shared by every account", default=DEFAULT_CACHE_PATH)
+
+    args = parser.parse_args()
+
+    with open(args.accounts) as accounts_file:
+        accounts = json.load(accounts_file)
+
+    summary = run_accounts(
+        accounts,
+        output_dir=args.output_dir,
+        processes=args.processes,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        csv_export=1 if args.csv else 0,
+        pickle=1 if args.pickle else 0,
+        max_workers=args.max_workers,
+        order_store=args.order_store,
+        instrument_cache=os.path.abspath(args.instrument_cache),
+    )
+    summary.to_csv(os.path.join(args.output_dir, 'summary.csv'))
+    print(summary)
+
+    sys.exit(0 if (summary['status'] == 'ok').all() else 1)
@@ -0,0 +1,275 @@
+"""tax_lots.py: tax-lot matching of sells against buys, with realized and unrealized PnL """
+
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from pnl_engine import SHARES_EPSILON
+
+
+LOT_METHODS = ('fifo', 'lifo', 'specific', 'average')
+
+# Lots held longer than this are long-term
+LONG_TERM_DAYS = 365
+
+
+class LotQueue:
+    """Open lots of a single ticker, in compact parallel arrays
+
+        Lots are appended in date order. FIFO consumes from a moving head
+        index and LIFO pops from the end, so nothing is ever shifted and
+        closing a sell costs O(lots it touches).
+    """
+
+    __slots__ = ('order_ids', 'dates', 'quantities', 'prices', 'head')
+
+    def __init__(self):
+        self.order_ids = []
+        self.dates = array('q')
+        self.quantities = array('d')
+        self.prices = array('d')
+        self.head = 0
+
+    def push(self, order_id, date, quantity, price):
+        self.order_ids.append(order_id)
+        self.dates.append(date)
+        self.quantities.append(quantity)
+        self.prices.append(price)
+
+    def _pop(self):
+        self.order_ids.pop()
+        self.dates.pop()
+        self.quantities.pop()
+        self.prices.pop()
+
+    def close(self, quantity, lifo=False):
+        """Close `quantity` shares from the head (FIFO) or the tail (LIFO)
+
+            Returns:
+                (tuple): list of (open date, quantity, price) of the lots closed,
+                    and the quantity left over when the open lots ran out
+        """
+
+        closed = []
+        quantities = self.quantities
+
+        while quantity > SHARES_EPSILON and len(quantities) > self.head:
+            slot = len(quantities) - 1 if lifo else self.head
+            lot = quantities[slot]
+
+            if lot <= quantity + SHARES_EPSILON:
+                closed.append((self.dates[slot], lot, self.prices[slot]))
+                quantity -= lot
+                if lifo:
+                    self._pop()
+                else:
+                    quantities[slot] = 0.0
+                    self.head += 1
+            else:
+                closed.append((self.dates[slot], quantity, self.prices[slot]))
+                quantities[slot] = lot - quantity
+                quantity = 0.0
+
+        return closed, max(quantity, 0.0)
+
+    def close_specific(self, lot_ids, quantity):
+        """Close shares from the named lots first, then FIFO
+
+            Args:
+                lot_ids (:obj:`list`): (buy order id, quantity) pairs
+                quantity (float): shares sold
+        """
+
+        closed = []
+        quantities = self.quantities
+        slots = dict((self.order_ids[slot], slot) for slot in range(self.head, len(quantities)))
+
+        for lot_id, lot_quantity in lot_ids:
+            slot = slots.get(lot_id)
+            if slot is None or quantity <= SHARES_EPSILON:
+                continue
+            taken = min(lot_quantity, quantity, quantities[slot])
+            if taken > 0:
+                closed.append((self.dates[slot], taken, self.prices[slot]))
+                quantities[slot] -= taken
+                quantity -= taken
+
+        # Skip lots the named matches emptied at the head or tail
+        while self.head < len(quantities) and quantities[self.head] <= SHARES_EPSILON:
+            self.head += 1
+        while len(quantities) > self.head and quantities[-1] <= SHARES_EPSILON:
+            self._pop()
+
+        fifo_closed, quantity = self.close(quantity)
+        return closed + [lot for lot in fifo_closed if lot[1] > SHARES_EPSILON], quantity
+
+    def open_slots(self):
+        quantities = self.quantities
+        return [slot for slot in range(self.head, len(quantities)) if quantities[slot] > SHARES_EPSILON]
+
+
+def match_lots(df_orders, method='fifo', specific_lots=None):
+    """Match every sell against open buy lots
+
+        Args:
+            df_orders (:obj:`DataFrame`): orders with `side`, `symbol`, `shares`,
+                `price` and `date` columns (or a date index), plus `id` for
+                specific-ID matching. Unexecuted orders (no price) are ignored.
+                Pass the full history: lots opened before a reporting window
+                are needed to price sells inside it.
+            method (str): one of 'fifo', 'lifo', 'specific', 'average'
+            specific_lots (:obj:`dict`, optional): for 'specific', sell order id ->
+                list of (buy order id, quantity); unlisted shares are matched FIFO
+
+        Returns:
+            (tuple): `realized`, one row per closed lot slice with `symbol`,
+                `open_date`, `close_date`, `quantity`, `proceeds`, `cost_basis`,
+                `realized_pnl`, `holding_days` and `term`; and `open_lots`, one
+                row per lot still held with `symbol`, `open_date`, `quantity`
+                and `price`
+    """
+
+    if method not in LOT_METHODS:
+        raise ValueError('method must be one of {}'.format(', '.join(LOT_METHODS)))
+
+    specific_lots = specific_lots or {}
+
+    price = pd.to_numeric(df_orders['price'], errors='coerce').values.astype(float)
+    executed = ~np.isnan(price)
+
+    if 'date' in df_orders.columns:
+        dates = pd.to_datetime(df_orders['date'], utc=True)
+    else:
+        dates = pd.to_datetime(df_orders.index.to_series(), utc=True)
+    dates = dates.values.astype('datetime64[ns]').astype(np.int64)[executed]
+
+    symbols = df_orders['symbol'].values[executed]
+    sides = df_orders['side'].values[executed]
+    shares = pd.to_numeric(df_orders['shares']).values.astype(float)[executed]
+    price = price[executed]
+    if 'id' in df_orders.columns:
+        order_ids = df_orders['id'].values[executed]
+    else:
+        order_ids = np.arange(len(price))
+
+    order = np.argsort(dates, kind='mergesort')
+    codes, uniques = pd.factorize(symbols[order])
+
+    # Plain lists in date order: scalar access on them is much cheaper than on ndarrays
+    is_buy = (sides[order] == 'buy').tolist()
+    shares = shares[order].tolist()
+    price = price[order].tolist()
+    dates = dates[order].tolist()
+    order_ids = order_ids[order].tolist()
+
+    queues = [LotQueue() for _ in range(len(uniques))]
+
+    # Average-cost bookkeeping per ticker: shares held and their total cost
+    held = [0.0] * len(uniques)
+    held_cost = [0.0] * len(uniques)
+
+    # Rows of the realized table: (symbol code, open date, close date, quantity, proceeds, cost basis)
+    rows = []
+    no_date = np.iinfo(np.int64).min
+    lifo = method == 'lifo'
+    averaging = method == 'average'
+
+    for position, code in enumerate(codes.tolist()):
+        quantity = shares[position]
+        if quantity <= SHARES_EPSILON:
+            continue
+
+        queue = queues[code]
+        fill_price = price[position]
+        date = dates[position]
+
+        if is_buy[position]:
+            queue.push(order_ids[position], date, quantity, fill_price)
+            if averaging:
+                held[code] += quantity
+                held_cost[code] += quantity * fill_price
+            continue
+
+        lot_ids = specific_lots.get(order_ids[position]) if method == 'specific' else None
+        if lot_ids:
+            closed, unmatched = queue.close_specific(lot_ids, quantity)
+        else:
+            closed, unmatched = queue.close(quantity, lifo)
+
+        if averaging:
+            average_price = held_cost[code] / held[code] if held[code] > SHARES_EPSILON else 0.0
+            for open_date, taken, _ in closed:
+                rows.append((code, open_date, date, taken, taken * fill_price, taken * average_price))
+                held[code] -= taken
+                held_cost[code] -= taken * average_price
+        else:
+            for open_date, taken, lot_price in closed:
+                rows.append((code, open_date, date, taken, taken * fill_price, taken * lot_price))
+
+        # Shares sold that were never bought (e.g. free gift stocks) have no basis
+        if unmatched > SHARES_EPSILON:
+            rows.append((code, no_date, date, unmatched, unmatched * fill_price, 0.0))
+
+    r_symbol, r_open, r_close, r_quantity, r_proceeds, r_cost = zip(*rows) if rows else ([],) * 6
+
+    realized = pd.DataFrame({
+        'symbol': np.asarray(uniques, dtype=object)[np.asarray(r_symbol, dtype=np.int64)],
+        'open_date': pd.to_datetime(np.asarray(r_open, dtype=np.int64), utc=True),
+        'close_date': pd.to_datetime(np.asarray(r_close, dtype=np.int64), utc=True),
+        'quantity': np.asarray(r_quantity, dtype=float),
+        'proceeds': np.asarray(r_proceeds, dtype=float),
+        'cost_basis': np.asarray(r_cost, dtype=float),
+    })
+    realized['realized_pnl'] = realized['proceeds'] - realized['cost_basis']
+    realized['holding_days'] = (realized['close_date'] - realized['open_date']).dt.days
+    realized['term'] = np.where(realized['holding_days'] > LONG_TERM_DAYS, 'long', 'short')
+    realized.loc[realized['open_date'].isnull(), 'term'] = 'unknown'
+
+    o_symbol, o_date, o_quantity, o_price = [], [], [], []
+    for code, queue in enumerate(queues):
+        average_price = held_cost[code] / held[code] if averaging and held[code] > SHARES_EPSILON else None
+        for slot in queue.open_slots():
+            o_symbol.append(uniques[code])
+            o_date.append(queue.dates[slot])
+            o_quantity.append(queue.quantities[slot])
+            o_price.append(queue.prices[slot] if average_price is None else average_price)
+
+    open_lots = pd.DataFrame({
+        'symbol': np.asarray(o_symbol, dtype=object),
+        'open_date': pd.to_datetime(np.asarray(o_date, dtype=np.int64), utc=True),
+        'quantity': np.asarray(o_quantity, dtype=float),
+        'price': np.asarray(o_price, dtype=float),
+    })
+
+    return realized, open_lots
+
+
+def unrealized_pl(open_lots, marks):
+    """Mark open lots to market
+
+        Args:
+            open_lots (:obj:`DataFrame`): as returned by `match_lots`
+            marks (:obj:`dict`): ticker -> current price
+
+        Returns:
+            (:obj:`DataFrame`): `open_lots` with `mark`, `market_value` and `unrealized_pnl` columns
+    """
+
+    lots = open_lots.copy()
+    lots['mark'] = lots['symbol'].map(marks).astype(float)
+    lots['market_value'] = lots['quantity'] * lots['mark']
+    lots['unrealized_pnl'] = lots['market_value'] - lots['quantity'] * lots['price']
+    return lots
+
+
+def realized_between(realized, start_date=None, end_date=None):
+    """Realized lots closed within a date range (inclusive, whole days) """
+
+    close_date = realized['close_date'].dt.tz_localize(None)
+    mask = np.ones(len(realized), dtype=bool)
+    if start_date is not None:
+        mask &= (close_date >= pd.Timestamp(start_date)).values
+    if end_date is not None:
+        mask &= (close_date < pd.Timestamp(end_date) + pd.Timedelta(days=1)).values
+    return realized[mask]
@@ -0,0 +1,46 @@
+"""transport.py: pooled, retrying HTTP session shared by the Robinhood client """
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# (connect, read) timeouts in seconds: fail fast on a dead host, allow slow pages
+DEFAULT_TIMEOUT = (3.05, 30)
+
+# Responses worth retrying: rate limited or a transient server error
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def build_session(retries=3, backoff_factor=0.5, pool_connections=10, pool_maxsize=20):
+    """Create a keep-alive session with a tuned connection pool and retries
+
+        Idempotent requests are retried on connection errors, read timeouts and
+        `RETRY_STATUSES`, with exponential backoff and `Retry-After` honored.
+
+        Args:
+            retries (int): retries per request
+            backoff_factor (float): base of the exponential backoff, in seconds
+            pool_connections (int): hosts to keep pools for
+            pool_maxsize (int): connections kept alive per host
+
+        Returns:
+            (:obj:`requests.Session`)
+    """
+
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+    session = requests.session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session